@@ -0,0 +1,218 @@
+"""
+A local stand-in for the parts of the Reddit API used by reddit-stalker.
+
+Every followed user posts a comment and a submission every `period` seconds (with a
+per-user phase), and has `history` older items of each kind. Items are derived from
+their position on that timeline, so nothing is stored and any user count is cheap.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+ID_OFFSET = 36**5
+
+
+def to_base36(number):
+    digits = ""
+    while number:
+        number, digit = divmod(number, 36)
+        digits = BASE36[digit] + digits
+    return digits or "0"
+
+
+class FakeReddit:
+    """
+    Synthetic user listings for `users` accounts named user00000, user00001...
+    """
+
+    def __init__(self, users, history=25, period=60.0, latency=0.0, start=None, dead=0.0):
+        self.names = ["user%05d" % index for index in range(users)]
+        # Suspended accounts: their listings are forbidden
+        self.dead = set(range(0, users, max(1, round(1 / dead)))) if dead else set()
+        self.index = {name: index for index, name in enumerate(self.names)}
+        self.history = history
+        self.period = period
+        self.latency = latency
+        self.start = time.time() if start is None else start
+        self.requests = 0
+        self.webhooks = []
+        self.webhook_down = False
+        self.lock = threading.Lock()
+
+    def phase(self, user):
+        return self.period * user / len(self.names)
+
+    def item_id(self, user, kind, k):
+        return ID_OFFSET + ((k + self.history) * len(self.names) + user) * 2 + kind
+
+    def position(self, fullname):
+        number = int(fullname.split("_", 1)[1], 36) - ID_OFFSET
+        return number // 2 // len(self.names) - self.history
+
+    def locate(self, id36):
+        number = int(id36, 36) - ID_OFFSET
+        return number // 2 % len(self.names), number % 2, number // 2 // len(self.names) - self.history
+
+    def created(self, user, k):
+        return self.start + k * self.period + self.phase(user)
+
+    def newest(self, user, now):
+        return int((now - self.start - self.phase(user)) // self.period)
+
+    def child(self, user, kind, k):
+        id36 = to_base36(self.item_id(user, kind, k))
+        data = {
+            "id": id36,
+            "author": self.names[user],
+            "created_utc": self.created(user, k),
+            "subreddit": "bench%d" % (k % 10),
+            "subreddit_id": "t5_bench%d" % (k % 10),
+            "subreddit_name_prefixed": "r/bench%d" % (k % 10),
+            "score": 1,
+            "num_comments": 0,
+        }
+        if kind == 0:
+            post = to_base36(self.item_id(user, 1, k))
+            data.update(name="t1_" + id36, link_id="t3_" + post, body="Comment %d by %s" % (k, self.names[user]))
+            return {"kind": "t1", "data": data}
+        data.update(name="t3_" + id36, title="Submission %d by %s" % (k, self.names[user]), selftext="", is_self=True)
+        return {"kind": "t3", "data": data}
+
+    def listing(self, name, kind, params):
+        user = self.index[name.lower()]
+        limit = min(int(params.get("limit", 25)), 100)
+        newest = self.newest(user, time.time())
+        oldest = -self.history
+        if params.get("before"):
+            oldest = max(oldest, self.position(params["before"]) + 1)
+        if params.get("after"):
+            newest = min(newest, self.position(params["after"]) - 1)
+        positions = list(range(newest, max(oldest, newest - limit + 1) - 1, -1))
+        children = [self.child(user, kind, k) for k in positions]
+        after = children[-1]["data"]["name"] if children and positions[-1] > oldest else None
+        return {"kind": "Listing", "data": {"children": children, "after": after, "before": None}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1  # send headers and body in one segment, avoiding delayed-ACK stalls on keep-alive connections
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-ratelimit-remaining", "100000")
+        self.send_header("x-ratelimit-used", "0")
+        self.send_header("x-ratelimit-reset", "600")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        fake = self.server.fake
+        with fake.lock:
+            fake.requests += 1
+        if fake.latency:
+            time.sleep(fake.latency)
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "user" and parts[1].lower() not in fake.index:
+            self._reply(404, {"message": "Not Found", "error": 404})
+            return
+        if len(parts) == 3 and parts[0] == "user" and parts[2] == "about":
+            user = fake.index[parts[1].lower()]
+            data = {"name": fake.names[user]}
+            data.update({"is_suspended": True} if user in fake.dead else {"created_utc": fake.start - 86400 * 365})
+            self._reply(200, {"kind": "t2", "data": data})
+            return
+        if len(parts) == 3 and parts[0] == "user" and parts[2] in ("comments", "submitted"):
+            if fake.index[parts[1].lower()] in fake.dead:
+                self._reply(403, {"message": "Forbidden", "error": 403})
+            else:
+                self._reply(200, fake.listing(parts[1], 0 if parts[2] == "comments" else 1, params))
+            return
+        if len(parts) >= 2 and parts[0] == "r":
+            # No subreddits here: reddit redirects listings of missing ones to the search
+            self.send_response(302)
+            self.send_header("Location", "/subreddits/search?q=%s" % parts[1])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if url.path.strip("/") == "api/info" and "sr_name" in params:
+            # Batched lookups of profile subreddits (see reddit_stalker.followings), which suspended accounts don't have
+            users = [fake.index.get(name.lower().partition("u_")[2]) for name in params["sr_name"].split(",")]
+            children = [
+                {"kind": "t5", "data": {"display_name": "u_" + fake.names[user], "name": "t5_%s" % to_base36(user + 1)}}
+                for user in users
+                if user is not None and user not in fake.dead
+            ]
+            self._reply(200, {"kind": "Listing", "data": {"children": children, "after": None, "before": None}})
+            return
+        if url.path.strip("/") == "api/info":
+            # Batched lookups of the thread titles comments don't carry (see reddit_stalker.enrich)
+            children = [
+                fake.child(*fake.locate(fullname.partition("_")[2])) for fullname in params.get("id", "").split(",") if fullname
+            ]
+            self._reply(200, {"kind": "Listing", "data": {"children": children, "after": None, "before": None}})
+            return
+        if len(parts) >= 2 and parts[0] == "comments":
+            # Lazy fetch of a single submission (praw does this for attributes missing from the listing)
+            submission = fake.child(*fake.locate(parts[1]))
+            empty = {"kind": "Listing", "data": {"children": [], "after": None, "before": None}}
+            self._reply(200, [{"kind": "Listing", "data": {"children": [submission], "after": None, "before": None}}, empty])
+            return
+        self._reply(404, {"message": "Not Found", "error": 404})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path.startswith("/webhook"):
+            # Stand-in for the endpoint of a webhook output sink, failing while webhook_down is set
+            if fake.webhook_down:
+                self._reply(503, {"message": "Service Unavailable", "error": 503})
+                return
+            with fake.lock:
+                fake.webhooks.append(json.loads(body))
+            self._reply(200, {})
+            return
+        if self.path.startswith("/api/v1/access_token"):
+            self._reply(200, {"access_token": "fake", "token_type": "bearer", "expires_in": 86400, "scope": "*"})
+            return
+        self._reply(404, {"message": "Not Found", "error": 404, "received": len(body)})
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def serve(fake, port=0):
+    """
+    Serve `fake` on localhost from a daemon thread and return the server (see server.server_port)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, name="fake-reddit", daemon=True).start()
+    return server
+
+
+def connect(server):
+    """
+    A praw.Reddit instance talking to the fake server
+    """
+    import praw  # pylint: disable=import-outside-toplevel
+
+    url = "http://127.0.0.1:%d" % server.server_port
+    return praw.Reddit(
+        client_id="bench",
+        client_secret="bench",
+        user_agent="reddit-stalker benchmark",
+        oauth_url=url,
+        reddit_url=url,
+        check_for_updates=False,
+    )
@@ -0,0 +1,135 @@
+"""
+Benchmark the stream loop against a local fake Reddit API.
+
+    python -m benchmarks.run --users 10 100 --output results.json
+
+Each scenario runs in a fresh process so that peak RSS is meaningful.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import time
+from reddit_stalker import __version__
+from reddit_stalker.accounts import AccountPool
+from reddit_stalker.enrich import Enricher
+from reddit_stalker.pipeline import Pipeline
+from reddit_stalker.sinks import Outputs, TerminalSink
+from reddit_stalker.stream import backfill, format_item, poll_streams, save_checkpoint
+from reddit_stalker.users import UserTable
+from .fake_reddit import FakeReddit, connect, serve
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(mode, users, latency, duration, history, period, dead):
+    fake = FakeReddit(users, history=history, period=period, latency=latency, dead=dead)
+    server = serve(fake)
+    reddit = connect(server)
+    pool = AccountPool.single(reddit, "bench")
+    subreddit_cache = {}
+    lags = []
+    outputs = Outputs([TerminalSink()], lambda item: format_item(item, subreddit_cache))
+
+    def output(item):
+        lags.append(time.time() - item.created_utc)
+        outputs(item)
+        save_checkpoint(item)
+
+    emit = Pipeline([Enricher(reddit)], output)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if mode == "backfill":
+            table = UserTable(pool)
+            table.add(fake.names, include_old=True)
+            requests = fake.requests
+            started = time.time()
+            backfill(table, 0, set(), emit)
+            emit.flush()
+            rounds = 1
+        else:
+            table = UserTable(pool)
+            table.add(fake.names)
+            poll_streams(pool, table, set(), emit)  # skip_existing: the first round only primes the streams
+            requests = fake.requests
+            started = time.time()
+            rounds = 0
+            while time.time() - started < duration or not rounds:
+                poll_streams(pool, table, set(), emit)
+                emit.flush()
+                rounds += 1
+        elapsed = time.time() - started
+    server.shutdown()
+
+    return {
+        "mode": mode,
+        "users": users,
+        "latency": latency,
+        "dead": dead,
+        "rounds": rounds,
+        "seconds": round(elapsed, 3),
+        "requests": fake.requests - requests,
+        "requests_per_second": round((fake.requests - requests) / elapsed, 1),
+        "items": len(lags),
+        "items_per_second": round(len(lags) / elapsed, 1),
+        "lag_p50": None if mode == "backfill" else percentile(lags, 0.5),
+        "lag_p95": None if mode == "backfill" else percentile(lags, 0.95),
+        "lag_mean": None if mode == "backfill" or not lags else statistics.mean(lags),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Followed user counts to benchmark")
+    parser.add_argument("--modes", nargs="+", choices=["backfill", "live"], default=["backfill", "live"])
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API response")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to stream for in live mode")
+    parser.add_argument("--history", type=int, default=25, help="Old items per user and listing")
+    parser.add_argument("--period", type=float, default=60.0, help="Seconds between new items per user and listing")
+    parser.add_argument("--dead", type=float, default=0.0, help="Fraction of followed accounts that are suspended")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("prawcore").setLevel(logging.ERROR)
+
+    results = []
+    for users in args.users:
+        for mode in args.modes:
+            logger.info("Running %s with %d users", mode, users)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(
+                    run_scenario, mode, users, args.latency, args.duration, args.history, args.period, args.dead
+                ).result()
+            logger.info("%s", result)
+            results.append(result)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "version": __version__,
+                "python": platform.python_version(),
+                "timestamp": time.time(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    logger.info("Results written to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import logging
+import time
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Below this many remaining requests, an account's users are moved elsewhere until its window resets
+LOW_REMAINING = 10
+# How long an account that failed authentication is left alone
+AUTH_RETRY = 15 * 60
+
+
+class AccountPool:
+    """
+    Several authenticated praw.Reddit instances (one per praw.ini site), with followed users spread
+    across them so that each account's rate limit budget adds up.
+    """
+
+    def __init__(self, accounts):
+        self.accounts = dict(accounts)
+        self.users = {site: [] for site in self.accounts}
+        self.site_of = {}
+        self.failed_until = {}
+
+    @classmethod
+    def single(cls, reddit, site="bot"):
+        return cls({site: reddit})
+
+    def available(self, site):
+        if self.failed_until.get(site, 0) > time.time():
+            return False
+        limits = self.accounts[site].auth.limits
+        remaining, reset = limits.get("remaining"), limits.get("reset_timestamp")
+        return remaining is None or remaining >= LOW_REMAINING or (reset is not None and reset <= time.time())
+
+    def _least_loaded(self):
+        candidates = [site for site in self.accounts if self.available(site)] or list(self.accounts)
+        return min(candidates, key=lambda site: len(self.users[site]))
+
+    def assign(self, user, site=None):
+        site = site or self._least_loaded()
+        self.users[site].append(user)
+        self.site_of[user.lower()] = site
+        return self.accounts[site]
+
+    def release(self, user):
+        site = self.site_of.pop(user.lower(), None)
+        if site is not None:
+            self.users[site] = [name for name in self.users[site] if name.lower() != user.lower()]
+
+    def account_for(self, user):
+        return self.accounts[self.site_of[user.lower()]]
+
+    def fail(self, user):
+        """
+        Mark the account serving `user` as failing authentication
+        """
+        site = self.site_of.get(user.lower())
+        if site is not None and self.failed_until.get(site, 0) <= time.time():
+            logger.error("Account %s failed authentication, moving its users to other accounts", site)
+            self.failed_until[site] = time.time() + AUTH_RETRY
+
+    def next_available(self):
+        """
+        When an account can be used again: now, unless they all failed authentication
+        """
+        now = time.time()
+        return min(max(self.failed_until.get(site, 0), now) for site in self.accounts)
+
+    def rebalance(self):
+        """
+        Move users off accounts that are rate limited or failing, and spread them evenly over the healthy ones.
+        Returns the users that changed account.
+        """
+        healthy = [site for site in self.accounts if self.available(site)]
+        if not healthy:
+            return []
+        moved = []
+        for site in self.accounts:
+            if site not in healthy:
+                for user in list(self.users[site]):
+                    self.release(user)
+                    self.assign(user, min(healthy, key=lambda candidate: len(self.users[candidate])))
+                    moved.append(user)
+        while True:
+            busiest = max(healthy, key=lambda site: len(self.users[site]))
+            idlest = min(healthy, key=lambda site: len(self.users[site]))
+            if len(self.users[busiest]) - len(self.users[idlest]) <= 1:
+                break
+            user = self.users[busiest][-1]
+            self.release(user)
+            self.assign(user, idlest)
+            moved.append(user)
+        if moved:
+            logger.info("Moved %d users between accounts", len(moved))
+        return moved
+
+    def update_rate_limits(self):
+        for site, reddit in self.accounts.items():
+            remaining = reddit.auth.limits.get("remaining")
+            if remaining is not None:
+                metrics.set(
+                    "reddit_stalker_ratelimit_remaining",
+                    remaining,
+                    doc="Requests left in the current rate limit window",
+                    site=site,
+                )
+            metrics.set("reddit_stalker_account_users", len(self.users[site]), doc="Users streamed by each account", site=site)
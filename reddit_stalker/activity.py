@@ -0,0 +1,52 @@
+"""
+Hour-of-week activity model: per user, 168 counters (hours since Monday 00:00 UTC) of the items they posted
+"""
+
+HOURS = 168
+# Users with fewer items than this are polled as usual
+MIN_ITEMS = 20
+# When a user's counters add up to more than this, they are halved, so that old habits fade out
+MAX_WEIGHT = 1000
+
+
+def hour_of_week(timestamp):
+    # 1970-01-01 was a Thursday
+    return int(timestamp // 3600 + 72) % HOURS
+
+
+def observe(model, offset, created):
+    """
+    Count an item created at `created` in the user model starting at `offset` of the `model` array
+    """
+    model[offset + hour_of_week(created)] += 1
+    if sum(model[offset : offset + HOURS]) > MAX_WEIGHT:
+        for hour in range(offset, offset + HOURS):
+            model[hour] /= 2
+
+
+def relative_activity(model, offset, when):
+    """
+    How active the user usually is around `when` (the hour before and after included), relative to their average:
+    0 if they never posted at that time, 1 if as much as usual. None without enough history.
+    """
+    row = model[offset : offset + HOURS]
+    total = sum(row)
+    if total < MIN_ITEMS:
+        return None
+    hour = hour_of_week(when)
+    return (row[hour - 1] + row[hour] + row[(hour + 1) % HOURS]) / 3 / (total / HOURS)
+
+
+def poll_delay(model, offset, now, interval, quiet_interval):
+    """
+    Time until the next poll: `interval` during the user's usual active hours, up to `quiet_interval` when they
+    are usually inactive, but without sleeping through the start of a busier hour
+    """
+    activity = relative_activity(model, offset, now)
+    if quiet_interval <= interval or activity is None or activity >= 1:
+        return interval
+    delay = quiet_interval - (quiet_interval - interval) * activity
+    next_hour = (now // 3600 + 1) * 3600
+    if now + delay > next_hour and relative_activity(model, offset, next_hour) > activity:
+        delay = max(interval, next_hour - now)
+    return delay
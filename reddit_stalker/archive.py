@@ -0,0 +1,78 @@
+import logging
+import sqlite3
+from array import array
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    fullname TEXT PRIMARY KEY,
+    author TEXT,
+    subreddit TEXT,
+    created_utc REAL,
+    title TEXT,
+    body TEXT,
+    permalink TEXT
+);
+CREATE INDEX IF NOT EXISTS items_author ON items (author, created_utc);
+CREATE TABLE IF NOT EXISTS series (
+    fullname TEXT PRIMARY KEY,
+    samples BLOB
+);
+"""
+
+
+class Archive:
+    """
+    SQLite copy of every emitted item, and of the score series sampled for them (see series.py).
+    Used as a pipeline stage: every batch is written in one transaction.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def __call__(self, items):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        item.name,
+                        str(item.author),
+                        item.subreddit.display_name,
+                        item.created_utc,
+                        vars(item).get("title") or vars(item).get("link_title"),
+                        vars(item).get("body", vars(item).get("selftext")),
+                        vars(item).get("permalink"),
+                    )
+                    for item in items
+                ],
+            )
+        return items
+
+    def save_series(self, series):
+        """
+        Store {fullname: array of samples}, replacing what was stored for these items
+        """
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO series VALUES (?, ?)",
+                [(fullname, samples.tobytes()) for fullname, samples in series.items()],
+            )
+
+    def series(self, fullname):
+        row = self.db.execute("SELECT samples FROM series WHERE fullname = ?", (fullname,)).fetchone()
+        samples = array("i")
+        if row:
+            samples.frombytes(row[0])
+        return samples
+
+    def activity(self, since):
+        """
+        (author, created_utc) of the items archived since `since`
+        """
+        return self.db.execute("SELECT author, created_utc FROM items WHERE created_utc >= ?", (since,))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,196 @@
+"""
+Raw capture: the JSON of every comment and submission in the listings fetched from reddit, appended to
+compressed NDJSON segments (one per --capture-segment period), each with a small index of the creation
+times per author, so that readers only decompress the segments they need.
+"""
+
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+from prawcore import Requestor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+# Compressed data is flushed to disk at least this often
+FLUSH_INTERVAL = 30
+
+
+def _children(payload):
+    """
+    The comments and submissions of a listing response (or of the listings of a comments page)
+    """
+    listings = payload if isinstance(payload, list) else [payload]
+    for listing in listings:
+        if isinstance(listing, dict) and listing.get("kind") == "Listing":
+            for child in listing["data"].get("children", []):
+                if child.get("kind") in ("t1", "t3"):
+                    yield child["data"]
+
+
+class CaptureLog:
+    """
+    Appends items to <directory>/capture-<start>.ndjson.zst (or .gz), starting a new segment every
+    `segment` seconds; <segment>.idx.json is the segment's index: its number of items, the range of their
+    creation times, and the same per author. Items already in the current segment are skipped.
+    With a `tag`, segments are named capture-<tag>-<start>, so that several processes can share the directory.
+    """
+
+    def __init__(self, directory, segment=3600, compression=None, tag=None):
+        if compression is None:
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package: pip install reddit-stalker[zstd]")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment = segment
+        self.compression = compression
+        self.prefix = "capture-%s-" % tag if tag else "capture-"
+        self.lock = threading.Lock()
+        self.path = None
+        self.file = None
+        self.writer = None
+        self.period = None
+        self.index = None
+        self.fullnames = set()
+        self.flushed = time.time()
+        atexit.register(self.close)
+
+    def _open(self, now):
+        self._close()
+        self.period = int(now // self.segment)
+        name = self.prefix + time.strftime("%Y%m%dT%H%M%S", time.gmtime(now))
+        self.path = os.path.join(self.directory, name + EXTENSIONS[self.compression])
+        self.file = open(self.path, "ab")  # pylint: disable=consider-using-with
+        if self.compression == "zstd":
+            self.writer = zstandard.ZstdCompressor(level=10).stream_writer(self.file)
+        else:
+            self.writer = gzip.GzipFile(fileobj=self.file, mode="ab", compresslevel=9)
+        self.index = {"segment": os.path.basename(self.path), "items": 0, "created": None, "authors": {}}
+        self.fullnames = set()
+
+    def _flush(self):
+        if self.compression == "zstd":
+            self.writer.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self.writer.flush()
+        self.file.flush()
+        with open(self.path + ".idx.json.tmp", "w") as f:
+            json.dump(self.index, f)
+        os.replace(self.path + ".idx.json.tmp", self.path + ".idx.json")
+        self.flushed = time.time()
+
+    def append(self, children):
+        now = time.time()
+        with self.lock:
+            if self.period != int(now // self.segment):
+                self._open(now)
+            for child in children:
+                if child.get("name") in self.fullnames:
+                    continue
+                self.fullnames.add(child.get("name"))
+                self.writer.write(json.dumps(child, separators=(",", ":")).encode("utf-8") + b"\n")
+                created, author = child.get("created_utc", 0), child.get("author")
+                self.index["items"] += 1
+                self.index["created"] = _extend(self.index["created"], created)
+                self.index["authors"][author] = _extend(self.index["authors"].get(author), created)
+            if now - self.flushed >= FLUSH_INTERVAL:
+                self._flush()
+
+    def _close(self):
+        if self.writer is None:
+            return
+        self._flush()
+        self.writer.close()
+        self.file.close()
+        self.writer = self.file = None
+        self.period = None
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+
+def _extend(entry, created):
+    """
+    [first created, last created, count] including one more item
+    """
+    if entry is None:
+        return [created, created, 1]
+    return [min(entry[0], created), max(entry[1], created), entry[2] + 1]
+
+
+def read_capture(directory, author=None, since=0, until=float("inf")):
+    """
+    The captured items (as dicts) created between `since` and `until`, of `author` if given.
+    Segments whose index rules them out are not read.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, "capture-*.ndjson.*"))):
+        if path.endswith(".json") or path.endswith(".tmp"):
+            continue
+        try:
+            with open(path + ".idx.json", "r") as f:
+                index = json.load(f)
+            span = index["authors"].get(author) if author else index["created"]
+            if span is None or span[1] < since or span[0] > until:
+                continue
+        except (OSError, ValueError, KeyError):
+            pass
+        if path.endswith(".zst"):
+            with open(path, "rb") as f:
+                lines = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True).read().splitlines()
+        else:
+            with gzip.open(path, "rb") as f:
+                lines = f.read().splitlines()
+        for line in lines:
+            try:
+                child = json.loads(line)
+            except ValueError:
+                # The last line of a segment that wasn't closed properly
+                continue
+            if (author is None or child.get("author") == author) and since <= child.get("created_utc", 0) <= until:
+                yield child
+
+
+class CaptureMixin:
+    """
+    Mixed into a prawcore Requestor class (see capturing()): passes the listings of every response to a CaptureLog
+    """
+
+    def __init__(self, *args, capture=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.capture = capture
+
+    def request(self, *args, timeout=None, **kwargs):
+        response = super().request(*args, timeout=timeout, **kwargs)
+        method, url = args[:2]
+        if method.upper() == "GET" and response.status_code == 200 and "/api/v1/" not in urlsplit(url).path:
+            try:
+                children = list(_children(json.loads(response.text)))
+            except ValueError:
+                children = []
+            if children:
+                self.capture.append(children)
+        return response
+
+
+def capturing(options, capture):
+    """
+    Add capture to requestor_options() (see cassette.py)
+    """
+    base = options.get("requestor_class", Requestor)
+    options = dict(options)
+    options["requestor_class"] = type("Capturing" + base.__name__, (CaptureMixin, base), {})
+    options["requestor_kwargs"] = dict(options.get("requestor_kwargs") or {}, capture=capture)
+    return options
@@ -0,0 +1,160 @@
+import atexit
+import collections
+import gzip
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+import requests
+from prawcore import Requestor
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# Token exchanges are never recorded; replay answers them with a dummy token
+OAUTH_PATHS = ("/api/v1/access_token", "/api/v1/authorize", "/api/v1/revoke_token")
+KEPT_HEADERS = ("content-type", "x-ratelimit-remaining", "x-ratelimit-used", "x-ratelimit-reset")
+EMPTY_LISTING = {"kind": "Listing", "data": {"children": [], "after": None, "before": None}}
+
+
+class CassetteExhausted(Exception):
+    pass
+
+
+def _key(method, url, params):
+    params = sorted((key, str(value)) for key, value in (params or {}).items() if key != "raw_json")
+    return "%s %s?%s" % (method.upper(), urlsplit(url).path.rstrip("/"), "&".join("%s=%s" % param for param in params))
+
+
+def _is_oauth(url):
+    return urlsplit(url).path.rstrip("/") in OAUTH_PATHS
+
+
+def _response(status, body, headers, url):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body.encode("utf-8")  # pylint: disable=protected-access
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = "utf-8"
+    response.url = url
+    return response
+
+
+class Recorder:
+    """
+    A gzipped NDJSON cassette being written; shared by the requestors of all accounts
+    """
+
+    def __init__(self, path):
+        self.started = time.time()
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.file.write(json.dumps({"cassette": 1, "started": self.started}) + "\n")
+        self.count = 0
+        atexit.register(self.close)
+
+    def close(self):
+        self.file.close()
+
+    def record(self, method, url, params, response):
+        entry = {
+            "t": round(time.time() - self.started, 3),
+            "k": _key(method, url, params),
+            "s": response.status_code,
+            "h": {header: response.headers[header] for header in KEPT_HEADERS if header in response.headers},
+            "b": response.text,
+        }
+        self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.count += 1
+        if self.count % 100 == 0:
+            self.file.flush()
+
+
+class Player:
+    """
+    The responses of a cassette, in recorded order per request; shared by the requestors of all accounts,
+    so that each response is replayed once whichever account asks for it
+    """
+
+    def __init__(self, path, speed=0):
+        self.speed = speed
+        self.entries = collections.defaultdict(collections.deque)
+        self.remaining = 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if "k" in entry:
+                    self.entries[entry["k"]].append(entry)
+                    self.remaining += 1
+        logger.info("Loaded %d responses from %s", self.remaining, path)
+        self.started = None
+
+    def play(self, method, url, params):
+        """
+        The next recorded response to a request, or None if there is none
+        """
+        if not self.remaining:
+            raise CassetteExhausted("No more recorded responses")
+        if self.started is None:
+            self.started = time.time()
+        try:
+            entry = self.entries[_key(method, url, params)].popleft()
+        except IndexError:
+            return None
+        self.remaining -= 1
+        if self.speed:
+            delay = self.started + entry["t"] / self.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        return entry
+
+
+class RecordingRequestor(Requestor):
+    """
+    A prawcore Requestor that appends every API response (except OAuth token exchanges)
+    to a cassette (a Recorder).
+    """
+
+    def __init__(self, *args, cassette=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+
+    def request(self, *args, timeout=None, **kwargs):
+        response = super().request(*args, timeout=timeout, **kwargs)
+        method, url = args[:2]
+        if not _is_oauth(url):
+            self.cassette.record(method, url, kwargs.get("params"), response)
+        return response
+
+
+class ReplayRequestor(Requestor):
+    """
+    A prawcore Requestor that answers requests from a cassette (a Player), optionally pacing them
+    at the recorded speed multiplied by the player's `speed` (0 replays as fast as possible).
+    """
+
+    def __init__(self, *args, cassette=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+
+    def request(self, *args, timeout=None, **kwargs):
+        method, url = args[:2]
+        if _is_oauth(url):
+            token = {"access_token": "replay", "token_type": "bearer", "expires_in": 86400, "scope": "*"}
+            return _response(200, json.dumps(token), {"content-type": "application/json"}, url)
+        entry = self.cassette.play(method, url, kwargs.get("params"))
+        if entry is None:
+            logger.debug("No recorded response for %s %s, answering with an empty listing", method, url)
+            return _response(200, json.dumps(EMPTY_LISTING), {"content-type": "application/json"}, url)
+        return _response(entry["s"], entry["b"], entry["h"], url)
+
+
+def requestor_options(record=None, replay=None, speed=0):
+    """
+    Keyword arguments for praw.Reddit() to record to or replay from a cassette.
+    The cassette is opened here: pass the same options to every praw.Reddit() sharing it.
+    """
+    if record:
+        return {"requestor_class": RecordingRequestor, "requestor_kwargs": {"cassette": Recorder(record)}}
+    if replay:
+        return {"requestor_class": ReplayRequestor, "requestor_kwargs": {"cassette": Player(replay, speed)}}
+    return {}
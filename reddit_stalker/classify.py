@@ -0,0 +1,127 @@
+"""
+Offline language, sentiment and toxicity tagging with small built-in lexicons
+"""
+
+import logging
+import math
+import re
+from .items import item_text
+from .metrics import metrics
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+STOPWORDS = {
+    "en": "the and is are was to of in that it for you with this on not but have be they what",
+    "es": "el la los las de que y en es por para con una un no pero muy esta como lo",
+    "fr": "le la les de des et est que une un pour pas dans sur avec mais très il elle je",
+    "de": "der die das und ist nicht ein eine zu mit auf für ich sie es aber sehr auch",
+    "it": "il lo la gli le di che e è per non una un con ma sono molto questo anche",
+    "pt": "o a os as de que e é não um uma para com mas muito isso você também",
+    "nl": "de het een en is van niet dat op te met voor maar zijn ik ook",
+}
+LANGUAGES = tuple(STOPWORDS)
+# An item needs at least this many stopwords of its language to be tagged with it ("und" otherwise)
+MIN_STOPWORDS = 2
+
+SENTIMENT = {
+    **dict.fromkeys("good nice cool fun glad agree helpful thanks thank like win interesting".split(), 1),
+    **dict.fromkeys("great love excellent awesome amazing best wonderful fantastic beautiful perfect happy".split(), 2),
+    **dict.fromkeys("bad wrong sad boring poor annoying fail broken ugly disagree".split(), -1),
+    **dict.fromkeys("terrible awful hate worst horrible angry disappointed sucks disgusting".split(), -2),
+}
+TOXIC = set("idiot idiots stupid moron morons dumb loser losers pathetic trash shut fuck fucking shit bitch asshole retard".split())
+
+# Feature columns: one per language, then the sentiment score and the number of toxic words
+SENTIMENT_COLUMN = len(LANGUAGES)
+TOXIC_COLUMN = len(LANGUAGES) + 1
+
+
+def _weights():
+    """
+    The vocabulary ({word: row}) and its weights: one row of feature values per word
+    """
+    words = sorted(set(" ".join(STOPWORDS.values()).split()) | set(SENTIMENT) | TOXIC)
+    rows = []
+    for word in words:
+        row = [1.0 if word in STOPWORDS[language].split() else 0.0 for language in LANGUAGES]
+        row += [float(SENTIMENT.get(word, 0)), 1.0 if word in TOXIC else 0.0]
+        rows.append(row)
+    return {word: index for index, word in enumerate(words)}, rows
+
+
+class Classifier:
+    """
+    Pipeline stage tagging items with `annotations` lang (ISO 639-1, or "und"), sentiment (-1 to 1) and
+    toxicity (0 to 1), and dropping those not in `languages` (if given) or beyond the sentiment and toxicity limits.
+    A batch is scored at once: its words become a (items x vocabulary) count matrix, multiplied by the lexicon
+    weights (with numpy; a plain Python loop over the words otherwise).
+    """
+
+    def __init__(self, languages=None, min_sentiment=None, max_toxicity=None):
+        self.languages = {language.lower() for language in languages} if languages else None
+        self.min_sentiment = min_sentiment
+        self.max_toxicity = max_toxicity
+        self.vocabulary, rows = _weights()
+        self.rows = rows
+        self.weights = numpy.array(rows) if numpy is not None else None
+
+    def features(self, texts):
+        """
+        The feature values of each text
+        """
+        ids = [[self.vocabulary[word] for word in TOKEN.findall(text.lower()) if word in self.vocabulary] for text in texts]
+        if self.weights is None:
+            features = []
+            for text_ids in ids:
+                values = [0.0] * len(self.rows[0])
+                for row in text_ids:
+                    values = [value + weight for value, weight in zip(values, self.rows[row])]
+                features.append(values)
+            return features
+        documents = numpy.repeat(numpy.arange(len(texts)), [len(text_ids) for text_ids in ids])
+        columns = numpy.fromiter((row for text_ids in ids for row in text_ids), dtype=numpy.int64, count=len(documents))
+        vocabulary_size = len(self.vocabulary)
+        counts = numpy.bincount(documents * vocabulary_size + columns, minlength=len(texts) * vocabulary_size)
+        return (counts.reshape(len(texts), vocabulary_size) @ self.weights).tolist()
+
+    @staticmethod
+    def annotations(values):
+        languages = values[:SENTIMENT_COLUMN]
+        best = max(range(len(LANGUAGES)), key=lambda column: languages[column])
+        ambiguous = languages.count(languages[best]) > 1
+        sentiment = values[SENTIMENT_COLUMN]
+        toxic = values[TOXIC_COLUMN]
+        return {
+            "lang": LANGUAGES[best] if languages[best] >= MIN_STOPWORDS and not ambiguous else "und",
+            "sentiment": round(sentiment / math.sqrt(sentiment * sentiment + 15), 2),
+            "toxicity": round(toxic / (toxic + 2), 2),
+        }
+
+    def _excluded(self, annotations):
+        if self.languages and annotations["lang"] != "und" and annotations["lang"] not in self.languages:
+            return "language"
+        if self.min_sentiment is not None and annotations["sentiment"] < self.min_sentiment:
+            return "sentiment"
+        if self.max_toxicity is not None and annotations["toxicity"] > self.max_toxicity:
+            return "toxicity"
+        return None
+
+    def __call__(self, items):
+        features = self.features([item_text(item) for item in items])
+        kept = []
+        for item, values in zip(items, features):
+            annotations = self.annotations(values)
+            item.annotations = dict(getattr(item, "annotations", None) or {}, **annotations)
+            reason = self._excluded(annotations)
+            if reason:
+                metrics.inc("reddit_stalker_filtered_total", doc="Items dropped by filters", reason=reason)
+                continue
+            kept.append(item)
+        return kept
@@ -0,0 +1,75 @@
+import time
+
+BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+# Type prefixes of the fullnames we see (t1_: comment, t3_: submission, ...) are folded into the low bits
+KIND_BITS = 3
+
+
+def fullname_key(fullname):
+    """
+    t1_abc -> int("abc", 36) with the type number in the low bits: much smaller than the string
+    """
+    kind, _, id36 = fullname.partition("_")
+    return int(id36, 36) << KIND_BITS | int(kind[1:])
+
+
+def key_fullname(key):
+    """
+    The inverse of fullname_key()
+    """
+    number, kind = key >> KIND_BITS, key & ((1 << KIND_BITS) - 1)
+    digits = ""
+    while number:
+        number, digit = divmod(number, 36)
+        digits = BASE36[digit] + digits
+    return "t%d_%s" % (kind, digits or "0")
+
+
+class SeenSet:
+    """
+    Fullnames already seen by any stream, stored as integers in two generations: every `max_age`
+    seconds the older generation is dropped, so entries live between one and two `max_age`s.
+    cutoff() tells how far back the set is complete (less far after shrink()).
+    """
+
+    def __init__(self, max_age=48 * 3600):
+        self.max_age = max_age
+        self.current = set()
+        self.previous = set()
+        self.rotated = time.time()
+        # Items seen before this time may have been dropped by shrink()
+        self.shrunk = 0
+
+    def _rotate(self):
+        now = time.time()
+        if now - self.rotated >= self.max_age:
+            self.previous = self.current if now - self.rotated < 2 * self.max_age else set()
+            self.current = set()
+            self.rotated = now
+
+    def cutoff(self):
+        """
+        Items created before this time may have been seen and forgotten: they must be ignored, not emitted again
+        """
+        return max(time.time() - self.max_age, self.shrunk)
+
+    def __contains__(self, fullname):
+        key = fullname_key(fullname)
+        return key in self.current or key in self.previous
+
+    def add(self, fullname):
+        self._rotate()
+        self.current.add(fullname_key(fullname))
+
+    def shrink(self):
+        """
+        Drop the older generation early, to save memory
+        """
+        self.previous = set()
+        self.shrunk = self.rotated
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
+
+
+seen = SeenSet()
@@ -0,0 +1,106 @@
+import heapq
+import logging
+import time
+from prawcore.exceptions import PrawcoreException
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Items kept per (user, subreddit) as candidates for the top items; their scores are refreshed when rendering
+CANDIDATES = 10
+# Beyond this many (user, subreddit) groups in a window, items are only counted per user
+MAX_GROUPS = 10000
+
+
+def _summary(item):
+    data = vars(item)
+    text = data.get("title") or data.get("link_title") or data.get("body") or ""
+    text = " ".join(text.split())
+    return text if len(text) <= 100 else text[:99] + "…"
+
+
+class Digest:
+    """
+    Pipeline stage taking the items of `users` out of the output, to be summarized every `window` seconds
+    (windows are aligned on multiples of `window`, i.e. hours or days, in UTC): per user and subreddit,
+    the number of items, and the `top` ones by score. Only counts and a few candidates per group are kept.
+    """
+
+    def __init__(self, reddit, users, window=3600, top=3):
+        self.reddit = reddit
+        self.users = {user.lower() for user in users}
+        self.window = window
+        self.top = top
+        self.started = time.time() // window * window
+        self.groups = {}
+        self.overflow = {}
+
+    def __call__(self, items):
+        kept = []
+        for item in items:
+            if str(item.author).lower() in self.users:
+                self._add(item)
+            else:
+                kept.append(item)
+        return kept
+
+    def _add(self, item):
+        metrics.inc("reddit_stalker_digested_items_total", doc="Items summarized in digests instead of being shown")
+        author = str(item.author)
+        key = (author, item.subreddit_name_prefixed)
+        if key not in self.groups and len(self.groups) >= MAX_GROUPS:
+            self.overflow[author] = self.overflow.get(author, 0) + 1
+            return
+        group = self.groups.setdefault(key, [0, []])
+        group[0] += 1
+        permalink = vars(item).get("permalink")
+        # Same scores: the older item wins, it has had more time to get votes
+        candidate = (vars(item).get("score") or 0, -item.created_utc, item.name, _summary(item), permalink)
+        if len(group[1]) < CANDIDATES:
+            heapq.heappush(group[1], candidate)
+        else:
+            heapq.heappushpop(group[1], candidate)
+
+    def due(self, now=None):
+        return (time.time() if now is None else now) >= self.started + self.window
+
+    def _scores(self, fullnames):
+        if not fullnames:
+            return {}
+        try:
+            return {thing.fullname: (thing.score, thing.num_comments) for thing in self.reddit.info(fullnames=fullnames)}
+        except PrawcoreException as ex:
+            logger.warning("Couldn't refresh the scores of the digest: %s", ex)
+            return {}
+
+    def collect(self):
+        """
+        Close the current window: returns its start time, and its digest per user (most active first) as
+        (user, number of items, [(subreddit, number of items)], [top items as dicts])
+        """
+        groups, overflow, started = self.groups, self.overflow, self.started
+        self.groups, self.overflow = {}, {}
+        self.started = time.time() // self.window * self.window
+        scores = self._scores(sorted({candidate[2] for _, candidates in groups.values() for candidate in candidates}))
+
+        users = {}
+        for (author, subreddit), (count, candidates) in groups.items():
+            entry = users.setdefault(author, [0, [], []])
+            entry[0] += count
+            entry[1].append((subreddit, count))
+            for score, _, fullname, text, permalink in candidates:
+                score, comments = scores.get(fullname, (score, None))
+                entry[2].append(
+                    {"subreddit": subreddit, "score": score, "num_comments": comments, "text": text, "permalink": permalink}
+                )
+        for author, count in overflow.items():
+            entry = users.setdefault(author, [0, [], []])
+            entry[0] += count
+            entry[1].append(("(other subreddits)", count))
+        digest = []
+        for author, (count, subreddits, candidates) in sorted(users.items(), key=lambda entry: -entry[1][0]):
+            subreddits.sort(key=lambda subreddit: -subreddit[1])
+            candidates.sort(key=lambda candidate: -candidate["score"])
+            digest.append((author, count, subreddits, candidates[: self.top]))
+        logger.info("Digest of %d users since %s", len(digest), time.ctime(started))
+        return started, digest
@@ -0,0 +1,73 @@
+import collections
+import logging
+from prawcore.exceptions import PrawcoreException
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        try:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        except KeyError:
+            return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Enricher:
+    """
+    Pipeline stage adding context that the listings don't always carry: the thread title of comments
+    (link_title) and the origin of crossposts (crosspost_parent_list). Everything a batch needs
+    is resolved with /api/info (100 fullnames per request), through an LRU cache.
+    """
+
+    def __init__(self, reddit, cache_size=10000):
+        self.reddit = reddit
+        self.cache = LRUCache(cache_size)
+
+    @staticmethod
+    def _parent(item):
+        data = vars(item)
+        if "link_id" in data and not data.get("link_title"):
+            return data["link_id"]
+        if data.get("crosspost_parent") and not data.get("crosspost_parent_list"):
+            return data["crosspost_parent"]
+        return None
+
+    def __call__(self, items):
+        parents = {self._parent(item) for item in items} - {None}
+        missing = sorted(fullname for fullname in parents if self.cache.get(fullname) is None)
+        if missing:
+            metrics.inc("reddit_stalker_enrichment_lookups_total", len(missing), doc="Fullnames resolved through /api/info")
+            try:
+                for thing in self.reddit.info(fullnames=missing):
+                    self.cache.put(thing.fullname, {"title": thing.title, "subreddit_name_prefixed": thing.subreddit_name_prefixed})
+            except PrawcoreException as ex:
+                logger.warning("Couldn't enrich %d items: %s", len(items), ex)
+        for item in items:
+            parent = self._parent(item)
+            context = self.cache.get(parent) if parent else None
+            if context is None:
+                continue
+            if "link_id" in vars(item):
+                item.link_title = context["title"]
+            else:
+                item.crosspost_parent_list = [context]
+        return items
@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import os
+import re
+import signal
+import time
+from prawcore.exceptions import Forbidden, NotFound, PrawcoreException
+from .items import read_list
+
+logger = logging.getLogger(__name__)
+
+# reddit returns at most 100 subscriptions per page
+PAGE_SIZE = 100
+# Every so many refreshes, page through everything even if the first page is unchanged
+FULL_REFRESH_EVERY = 6
+USERNAME = re.compile(r"^[A-Za-z0-9_-]{3,20}$")
+
+
+def _fingerprint(names):
+    return hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()
+
+
+def get_followers(reddit, limit=None):
+    """
+    Users you follow show up as u_<name> subreddits in your subscriptions.
+    Returns (followers, fingerprint of the first page of subscriptions)
+    """
+    names = [subscription.display_name for subscription in reddit.user.subreddits(limit=limit)]
+    followers = [name.replace("u_", "", 1) for name in names if name.startswith("u_")]
+    return followers, _fingerprint(names[:PAGE_SIZE])
+
+
+def _canonical_name(reddit, name):
+    """
+    The properly cased name of an account, or None if it doesn't exist
+    """
+    try:
+        return reddit.request(method="GET", path="user/%s/about" % name)["data"]["name"]
+    except (NotFound, Forbidden):
+        return None
+    except (PrawcoreException, KeyError) as ex:
+        logger.warning("Couldn't validate u/%s (%s), keeping it", name, ex)
+        return name
+
+
+def _profiles(reddit, names):
+    """
+    {lowercase name: properly cased name} of the accounts whose profile (the u_<name> subreddit) exists,
+    looked up 100 at a time
+    """
+    try:
+        return {
+            profile.display_name[2:].lower(): profile.display_name[2:]
+            for profile in reddit.info(subreddits=["u_" + name for name in names])
+            if profile.display_name.lower().startswith("u_")
+        }
+    except PrawcoreException as ex:
+        logger.warning("Couldn't look up profiles (%s), checking accounts one by one", ex)
+        return {}
+
+
+def validate_users(reddit, names, known=None):
+    """
+    Look up the given usernames: their profiles in batches, then accounts without one (suspended or deleted,
+    mostly) one by one. Returns {lowercase name: properly cased name, or None if invalid}.
+    Names in `known` are not looked up again.
+    """
+    known = {} if known is None else known
+    new_names = sorted({name.lower(): name for name in names if name.lower() not in known}.values())
+    todo = [name for name in new_names if USERNAME.match(name)]
+    if todo:
+        logger.info("Validating %d usernames", len(todo))
+        profiles = _profiles(reddit, todo)
+        for name in todo:
+            known[name.lower()] = profiles.get(name.lower()) or _canonical_name(reddit, name)
+    for name in new_names:
+        if known.setdefault(name.lower(), None) is None:
+            logger.warning("Ignoring u/%s: no such user", name)
+    return known
+
+
+def validate_subreddits(reddit, names):
+    """
+    The properly cased names of the subreddits that exist among `names` (all of them if they can't be looked up)
+    """
+    names = sorted(names, key=str.lower)
+    if not names:
+        return names
+    try:
+        found = {subreddit.display_name.lower(): subreddit.display_name for subreddit in reddit.info(subreddits=names)}
+    except PrawcoreException as ex:
+        logger.warning("Couldn't validate the subreddits (%s), keeping them", ex)
+        return names
+    for name in names:
+        if name.lower() not in found:
+            logger.warning("Ignoring r/%s: no such subreddit", name)
+    return [found[name.lower()] for name in names if name.lower() in found]
+
+
+class FollowList:
+    """
+    Builds the follow list, and tracks whether it needs to be recomputed: when --users-file is modified,
+    when --followers changed (checked every --followers-refresh minutes), or on SIGHUP.
+    """
+
+    def __init__(self, reddit, args):
+        self.reddit = reddit
+        self.args = args
+        self.reload_requested = False
+        self.mtime = self._mtime()
+        self.me = reddit.user.me().name if args.follow_me else None
+        self.followers = []
+        self.fingerprint = None
+        self.refreshes = 0
+        self.next_refresh = None
+        self.validated = {}
+        self.file_users = []
+        if args.followers:
+            self.refresh_followers(full=True)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._request_reload)
+
+    def _request_reload(self, signum, frame):  # pylint: disable=unused-argument
+        self.reload_requested = True
+
+    def _mtime(self):
+        if not self.args.users_file:
+            return None
+        try:
+            return os.stat(self.args.users_file).st_mtime
+        except OSError as ex:
+            # Only warn once while the file is missing
+            if getattr(self, "mtime", 0) is not None:
+                logger.warning("Can't watch %s: %s", self.args.users_file, ex)
+            return None
+
+    def refresh_followers(self, full=False):
+        """
+        Re-enumerate the users you follow. Unless `full`, only the first page is fetched
+        when it is identical to last time. Returns True if the followers changed.
+        """
+        if self.args.followers_refresh:
+            self.next_refresh = time.time() + self.args.followers_refresh * 60
+        self.refreshes += 1
+        if not full and self.refreshes % FULL_REFRESH_EVERY:
+            _, fingerprint = get_followers(self.reddit, limit=PAGE_SIZE)
+            if fingerprint == self.fingerprint:
+                logger.debug("First page of subscriptions unchanged, not refreshing followers")
+                return False
+        logger.info("Getting a list of users you are following")
+        followers, self.fingerprint = get_followers(self.reddit)
+        changed = sorted(followers) != sorted(self.followers)
+        self.followers = followers
+        return changed
+
+    def changed(self):
+        mtime = self._mtime()
+        changed = mtime != self.mtime
+        self.mtime = mtime
+        if self.reload_requested:
+            self.reload_requested = False
+            changed = True
+            if self.args.followers:
+                self.refresh_followers(full=True)
+        elif self.next_refresh is not None and time.time() >= self.next_refresh:
+            changed = self.refresh_followers() or changed
+        return changed
+
+    def load(self):
+        """
+        The follow list: deduplicated case-insensitively, with --users and --users-file names validated
+        (and properly cased) the first time they are seen
+        """
+        followings = {name.lower(): name for name in self.followers}
+        listed = list(self.args.users or [])
+        if self.args.users_file:
+            try:
+                self.file_users = read_list(self.args.users_file)
+            except OSError as ex:
+                logger.warning("Can't read %s, keeping its previous users: %s", self.args.users_file, ex)
+            listed.extend(self.file_users)
+        validate_users(self.reddit, [name for name in listed if name.lower() not in followings], self.validated)
+        for name in listed:
+            canonical = followings.get(name.lower()) or self.validated.get(name.lower())
+            if canonical:
+                followings[name.lower()] = canonical
+        if self.me:
+            followings[self.me.lower()] = self.me
+
+        return sorted(followings.values(), key=str.lower)
+
+
+def diff_followings(old, new):
+    """
+    Returns (added, removed), comparing usernames case-insensitively
+    """
+    old_names = {name.lower() for name in old}
+    new_names = {name.lower() for name in new}
+    added = [name for name in new if name.lower() not in old_names]
+    removed = [name for name in old if name.lower() not in new_names]
+    return added, removed
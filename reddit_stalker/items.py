@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+# /api/info takes up to 100 fullnames
+BATCH_SIZE = 100
+
+# Attributes of comments and submissions that the output path relies on
+FIELDS = (
+    "id",
+    "name",
+    "link_id",
+    "link_title",
+    "body",
+    "title",
+    "selftext",
+    "crosspost_parent",
+    "crosspost_parent_list",
+    "created_utc",
+    "subreddit_id",
+    "subreddit_name_prefixed",
+    "permalink",
+    "score",
+    "num_comments",
+)
+
+
+def snapshot(item):
+    """
+    A plain, picklable copy of a praw comment or submission.
+    Reads the instance dict directly, so missing attributes never trigger a lazy fetch.
+    Attributes that an item doesn't have are left out, so `item.link_id` still tells comments from submissions.
+    """
+    if isinstance(item, SimpleNamespace):
+        return item
+    data = vars(item)
+    fields = {key: data[key] for key in FIELDS if key in data}
+    fields["author"] = str(data.get("author"))
+    fields["subreddit"] = SimpleNamespace(display_name=str(data.get("subreddit")))
+    return SimpleNamespace(**fields)
+
+
+def item_text(item):
+    data = vars(item)
+    return "\n".join(data.get(key) or "" for key in ("title", "selftext", "body"))
+
+
+def read_list(path):
+    """
+    One entry per line (usernames, watch terms); blank lines and lines starting with # are ignored
+    """
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def item_url(item):
+    if "link_id" in vars(item):
+        return "https://www.reddit.com/comments/%s/_/%s/" % (item.link_id.replace("t3_", ""), item.id)
+    return "https://www.reddit.com/%s/" % item.id
+
+
+# Optional attributes copied into records when present
+RECORD_FIELDS = ("link_id", "link_title", "title", "body", "selftext", "permalink", "score", "num_comments")
+
+
+def to_record(item):
+    """
+    A JSON-friendly dict describing an item, for the output sinks
+    """
+    data = vars(item)
+    record = {
+        "kind": "comment" if "link_id" in data else "submission",
+        "fullname": item.name,
+        "author": str(data.get("author")),
+        "subreddit": item.subreddit.display_name,
+        "created_utc": item.created_utc,
+        "url": item_url(item),
+    }
+    record.update((key, data[key]) for key in RECORD_FIELDS if data.get(key) is not None)
+    for key in ("annotations", "watch_matches"):
+        if data.get(key):
+            record[key] = data[key]
+    return record
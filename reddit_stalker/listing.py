@@ -0,0 +1,67 @@
+import collections
+from .dedup import seen
+
+
+class ListingStream:
+    """
+    Like praw's stream_generator with pause_after=-1: every round fetches the listing once, yields
+    the new items oldest first and then None. Items are deduplicated against the shared `seen` set
+    instead of a set per stream, and the stream keeps working after an API error.
+
+    With skip_existing, the first round only marks the current items as seen. Unless include_old,
+    items older than the seen set's retention are ignored, so evicted ones don't come back.
+    """
+
+    def __init__(self, function, skip_existing=False, include_old=False, first_round=True, before=None, without_before_counter=0):
+        self.function = function
+        self.skip_existing = skip_existing
+        self.include_old = include_old
+        self.first_round = first_round
+        self.before = before
+        self.without_before_counter = without_before_counter
+        self.last_created = None
+        # Creation times of the new items of the last round (including skipped existing ones)
+        self.created = []
+        self.polled = False
+        self.pending = collections.deque()
+        self.fetched = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pending:
+            return self.pending.popleft()
+        if self.fetched:
+            self.fetched = False
+            return None
+        self.pending.extend(self.fetch())
+        self.fetched = True
+        self.polled = True
+        return next(self)
+
+    def fetch(self):
+        limit = 100
+        if self.before is None:
+            # Vary the limit to get past reddit's listing cache, as praw does
+            limit -= self.without_before_counter
+            self.without_before_counter = (self.without_before_counter + 1) % 30
+        # Older items may have been evicted from the seen set; they were handled long ago
+        cutoff = seen.cutoff()
+        new_items = []
+        newest = None
+        self.created = []
+        for item in reversed(list(self.function(limit=limit, params={"before": self.before}))):
+            fullname = item.fullname
+            if fullname in seen or (item.created_utc < cutoff and not (self.first_round and self.include_old)):
+                continue
+            seen.add(fullname)
+            newest = fullname
+            self.last_created = max(self.last_created or 0, item.created_utc)
+            self.created.append(item.created_utc)
+            if not self.skip_existing:
+                new_items.append(item)
+        self.before = newest
+        self.skip_existing = False
+        self.first_round = False
+        return new_items
@@ -0,0 +1,42 @@
+import gc
+import logging
+import os
+import resource
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss():
+    """
+    Resident set size in bytes (peak RSS where /proc isn't available)
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryBudget:
+    """
+    A soft limit on resident memory: callers check exceeded() and shed what they can
+    """
+
+    def __init__(self, megabytes):
+        self.limit = megabytes * 2**20
+        self.warned = 0
+
+    def exceeded(self):
+        return current_rss() > self.limit
+
+    def shed(self, *caches):
+        """
+        Empty the given caches (anything with clear() or shrink()) and collect garbage
+        """
+        for cache in caches:
+            getattr(cache, "shrink", getattr(cache, "clear", None))()
+        gc.collect()
+        if time.time() - self.warned > 60:
+            self.warned = time.time()
+            logger.warning("Over the memory budget (%.0f MiB resident), dropped caches", current_rss() / 2**20)
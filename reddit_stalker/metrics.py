@@ -0,0 +1,136 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 21600, 86400)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels) + "}"
+
+
+class Metrics:
+    """
+    A minimal, thread-safe registry of counters, gauges and histograms,
+    rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._values = {}
+        self._histograms = {}
+
+    def _declare(self, name, kind, doc):
+        if name not in self._types:
+            self._types[name] = kind
+            self._help[name] = doc
+
+    def inc(self, name, amount=1, doc="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, "counter", doc)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, doc="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, "gauge", doc)
+            self._values[key] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, doc="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, "histogram", doc)
+            try:
+                bounds, counts, total = self._histograms[key]
+            except KeyError:
+                bounds, counts, total = buckets, [0] * (len(buckets) + 1), [0.0, 0]
+                self._histograms[key] = (bounds, counts, total)
+            counts[bisect.bisect_left(bounds, value)] += 1
+            total[0] += value
+            total[1] += 1
+
+    def snapshot(self):
+        """
+        Everything recorded so far, as plain data (to send it to another process, see merge())
+        """
+        with self._lock:
+            return {
+                "types": dict(self._types),
+                "help": dict(self._help),
+                "values": dict(self._values),
+                "histograms": {
+                    key: (bounds, list(counts), list(total)) for key, (bounds, counts, total) in self._histograms.items()
+                },
+            }
+
+    def merge(self, snapshot, **labels):
+        """
+        Replace the metrics carrying `labels` by those of a snapshot() taken in another process
+        """
+        extra = tuple(sorted(labels.items()))
+        with self._lock:
+            for name, kind in snapshot["types"].items():
+                self._declare(name, kind, snapshot["help"][name])
+            for (name, key_labels), value in snapshot["values"].items():
+                self._values[(name, tuple(sorted(key_labels + extra)))] = value
+            for (name, key_labels), histogram in snapshot["histograms"].items():
+                self._histograms[(name, tuple(sorted(key_labels + extra)))] = histogram
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted(self._types):
+                lines.append("# HELP %s %s" % (name, self._help[name]))
+                lines.append("# TYPE %s %s" % (name, self._types[name]))
+                for (key_name, labels), value in sorted(self._values.items()):
+                    if key_name == name:
+                        lines.append("%s%s %s" % (name, _format_labels(labels), value))
+                for (key_name, labels), (bounds, counts, total) in sorted(self._histograms.items()):
+                    if key_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(bounds) + ["+Inf"], counts):
+                        cumulative += count
+                        lines.append("%s_bucket%s %d" % (name, _format_labels(labels + (("le", bound),)), cumulative))
+                    lines.append("%s_sum%s %s" % (name, _format_labels(labels), total[0]))
+                    lines.append("%s_count%s %d" % (name, _format_labels(labels), total[1]))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+def serve(port, host="localhost"):
+    """
+    Serve /metrics on the given port from a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,90 @@
+import collections
+import concurrent.futures
+import logging
+import time
+from .metrics import metrics
+from .profiling import span
+
+logger = logging.getLogger(__name__)
+
+
+def _completed(batch):
+    future = concurrent.futures.Future()
+    future.set_result(batch)
+    return future
+
+
+class Pipeline:
+    """
+    Used as the emit() callback: items are buffered and processed in batches, each batch going
+    through every stage (a callable taking and returning a list of items) and then to `output`.
+    A batch is flushed when it reaches `batch_size` items, when its oldest item has waited
+    `max_delay` seconds, or explicitly (at the end of every round).
+
+    A `deferred` stage (see plugins.py) runs last, asynchronously: its submit() returns a future, and batches
+    are output (in order) by the first flush after their future is done, so the caller never waits for it.
+    A batch whose future isn't done after `deferred_timeout` seconds is output as it was submitted.
+    """
+
+    def __init__(self, stages, output, batch_size=100, max_delay=1.0, deferred=None, deferred_timeout=60):
+        self.stages = stages
+        self.output = output
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.deferred = deferred
+        self.deferred_timeout = deferred_timeout
+        self.batch = []
+        self.started = None
+        self.pending = collections.deque()
+
+    def __call__(self, item):
+        if not self.batch:
+            self.started = time.time()
+        self.batch.append(item)
+        if len(self.batch) >= self.batch_size or time.time() - self.started >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        for stage in self.stages:
+            if not batch:
+                break
+            with span(type(stage).__name__.lower()):
+                batch = stage(batch)
+        if batch:
+            future = self.deferred.submit(batch) if self.deferred else _completed(batch)
+            # (deadline, batch as submitted, future)
+            self.pending.append((time.time() + self.deferred_timeout, batch, future))
+        self._drain()
+
+    def _drain(self, wait=False):
+        """
+        Output the batches at the head of the queue that are done (or past their deadline);
+        with `wait`, wait for each of them until its deadline
+        """
+        while self.pending:
+            deadline, batch, future = self.pending[0]
+            if wait:
+                concurrent.futures.wait([future], timeout=max(0, deadline - time.time()))
+            if future.done():
+                batch = future.result()
+            elif time.time() >= deadline and future.cancel():
+                logger.warning("Deferred stage timed out, outputting a batch of %d items without it", len(batch))
+                metrics.inc("reddit_stalker_deferred_timeouts_total", doc="Batches output without the deferred stage")
+            elif wait:
+                # Finishing (it couldn't be cancelled)
+                batch = future.result()
+            else:
+                break
+            self.pending.popleft()
+            for item in sorted(batch, key=lambda item: item.created_utc):
+                self.output(item)
+
+    def close(self):
+        """
+        Flush, output the batches still in the deferred stage (waiting for them until their deadline), and shut it down
+        """
+        self.flush()
+        self._drain(wait=True)
+        if self.deferred:
+            self.deferred.shutdown()
@@ -0,0 +1,125 @@
+"""
+Plugins are installed packages declaring a `reddit_stalker.plugins` entry point, e.g. in their setup.py:
+
+    entry_points={"reddit_stalker.plugins": ["translate = my_package:translate"]}
+
+The entry point is a callable taking a list of items (plain snapshots, see items.py) and returning one dict
+per item (or None). They run in a pool of worker processes; the dicts are merged into each item's
+`annotations`, which format_item shows under the item.
+"""
+
+import concurrent.futures
+import concurrent.futures.process
+import importlib.metadata
+import logging
+import multiprocessing
+from .items import snapshot
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GROUP = "reddit_stalker.plugins"
+
+# Plugins loaded in this (worker) process, by name
+_loaded = {}
+
+
+def discover():
+    """
+    The installed plugins, by name
+    """
+    entry_points = importlib.metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=GROUP)
+    else:
+        entry_points = entry_points.get(GROUP, [])
+    return {entry_point.name: entry_point for entry_point in entry_points}
+
+
+def _run(names, items):
+    """
+    Run the plugins over a batch, in a worker process. A failing plugin doesn't prevent the others from running.
+    """
+    annotations = [{} for _ in items]
+    for name in names:
+        try:
+            if name not in _loaded:
+                _loaded[name] = discover()[name].load()
+            results = _loaded[name](items)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.warning("Plugin %s failed: %s", name, ex)
+            continue
+        for item_annotations, result in zip(annotations, results or []):
+            item_annotations.update(result or {})
+    return annotations
+
+
+class _Annotated(concurrent.futures.Future):
+    """
+    The result of a batch going through the plugins: the batch itself, with the annotations attached.
+    Once cancelled (see Pipeline), late annotations are dropped.
+    """
+
+    def __init__(self, items, future):
+        super().__init__()
+        self.items = items
+        self.future = future
+        future.add_done_callback(self._done)
+
+    def cancel(self):
+        cancelled = super().cancel()
+        if cancelled:
+            self.future.cancel()
+        return cancelled
+
+    def _done(self, future):
+        if not self.set_running_or_notify_cancel():
+            return
+        try:
+            annotations = future.result()
+            for item, item_annotations in zip(self.items, annotations):
+                if item_annotations:
+                    item.annotations = {**(getattr(item, "annotations", None) or {}), **item_annotations}
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.warning("Plugins failed on a batch of %d items: %s", len(self.items), ex)
+        finally:
+            self.set_result(self.items)
+
+
+class Plugins:
+    """
+    Deferred pipeline stage: submit() hands a batch to the worker processes and returns at once,
+    with a future resolving to the annotated batch
+    """
+
+    def __init__(self, names=None, workers=None):
+        installed = discover()
+        unknown = sorted(set(names or []) - set(installed))
+        if unknown:
+            logger.warning("Plugins not installed: %s", ", ".join(unknown))
+        self.names = sorted(installed) if not names else [name for name in names if name in installed]
+        logger.info("Plugins: %s", ", ".join(self.names) or "none")
+        self.workers = workers
+        self.executor = self._executor()
+
+    def _executor(self):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, items):
+        metrics.inc("reddit_stalker_plugin_batches_total", doc="Batches handed to the plugins")
+        snapshots = [snapshot(item) for item in items]
+        try:
+            future = self.executor.submit(_run, self.names, snapshots)
+        except concurrent.futures.process.BrokenProcessPool:
+            logger.warning("A plugin worker process died, starting new ones")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._executor()
+            future = self.executor.submit(_run, self.names, snapshots)
+        return _Annotated(items, future)
+
+    def shutdown(self):
+        # Worker processes stuck in a plugin would keep the interpreter from exiting
+        processes = list((self.executor._processes or {}).values())  # pylint: disable=protected-access
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,92 @@
+import atexit
+import contextlib
+import cProfile
+import logging
+import signal
+import threading
+import time
+import tracemalloc
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def record_span(name, seconds):
+    metrics.observe("reddit_stalker_span_seconds", seconds, doc="Time spent in each stage of the stream loop", span=name)
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Time a stage of the stream loop (fetch, filter, render, checkpoint...)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+class CpuProfiler:
+    """
+    cProfile for the whole process. Stats are written on exit and whenever SIGUSR1 is received.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def dump(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.output)
+        self.profile.enable()
+        logger.warning("CPU profile written to %s (inspect with python -m pstats)", self.output)
+
+
+class MemoryProfiler:
+    """
+    tracemalloc snapshots, logging the top allocators every `interval` seconds and on SIGUSR1.
+    """
+
+    def __init__(self, output, interval, top=15):
+        self.output = output
+        self.interval = interval
+        self.top = top
+
+    def start(self):
+        tracemalloc.start(25)
+        if self.interval:
+            threading.Thread(target=self._run, name="memory-profiler", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.dump()
+
+    def dump(self):
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(self.output)
+        current, peak = tracemalloc.get_traced_memory()
+        lines = ["Traced memory: current %.1f MiB, peak %.1f MiB" % (current / 2**20, peak / 2**20)]
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            lines.append("  %s" % stat)
+        logger.warning("\n".join(lines))
+
+
+def start_profiling(mode, output=None, interval=60):
+    """
+    Start the requested profiler and arrange for its results to be written on exit and SIGUSR1.
+    """
+    if mode == "cpu":
+        profiler = CpuProfiler(output or "/tmp/reddit_stalker.prof")
+    else:
+        profiler = MemoryProfiler(output or "/tmp/reddit_stalker.snapshot", interval)
+    profiler.start()
+    atexit.register(profiler.dump)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.dump())
+    logger.info("Started %s profiling", mode)
+    return profiler
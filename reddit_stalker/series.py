@@ -0,0 +1,85 @@
+import heapq
+import logging
+import time
+from array import array
+from prawcore.exceptions import PrawcoreException
+from .dedup import fullname_key, key_fullname
+from .items import BATCH_SIZE
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 900
+# Per sample: seconds since the item's creation, score, number of comments
+SAMPLE_WIDTH = 3
+
+
+class ScoreTracker:
+    """
+    Pipeline stage sampling the score and number of comments of every item every `interval` seconds until it is
+    `window` seconds old, with /api/info (100 items per request). Each item's samples are kept in a flat
+    array of ints, written to the archive after every batch.
+    """
+
+    def __init__(self, reddit, archive, window=24 * 3600, interval=SAMPLE_INTERVAL):
+        self.reddit = reddit
+        self.archive = archive
+        self.window = window
+        self.interval = interval
+        self.tracked = {}
+        self.schedule = []
+
+    def __call__(self, items):
+        now = time.time()
+        for item in items:
+            if item.created_utc + self.window <= now:
+                continue
+            samples = array("i")
+            self._sample(samples, item.created_utc, item, now)
+            key = fullname_key(item.name)
+            self.tracked[key] = (item.created_utc, samples)
+            heapq.heappush(self.schedule, (now + self.interval, key))
+        metrics.set("reddit_stalker_score_series", len(self.tracked), doc="Items whose score is being sampled")
+        return items
+
+    @staticmethod
+    def _sample(samples, created, thing, now):
+        data = vars(thing)
+        samples.extend((int(now - created), data.get("score") or 0, data.get("num_comments") or 0))
+
+    def _due(self, now):
+        keys = []
+        while self.schedule and self.schedule[0][0] <= now and len(keys) < BATCH_SIZE:
+            key = heapq.heappop(self.schedule)[1]
+            if key in self.tracked:
+                keys.append(key)
+        return keys
+
+    def check(self):
+        now = time.time()
+        keys = self._due(now)
+        while keys:
+            self._check_batch(keys, now)
+            keys = self._due(now)
+        metrics.set("reddit_stalker_score_series", len(self.tracked), doc="Items whose score is being sampled")
+
+    def _check_batch(self, keys, now):
+        metrics.inc("reddit_stalker_score_requests_total", doc="/api/info requests made to sample scores")
+        try:
+            things = {
+                fullname_key(thing.fullname): thing for thing in self.reddit.info(fullnames=[key_fullname(key) for key in keys])
+            }
+        except PrawcoreException as ex:
+            logger.warning("Couldn't sample the score of %d items: %s", len(keys), ex)
+            things = {}
+        updated = {}
+        for key in keys:
+            created, samples = self.tracked[key]
+            if key in things:
+                self._sample(samples, created, things[key], now)
+                updated[key_fullname(key)] = samples
+            if created + self.window > now + self.interval:
+                heapq.heappush(self.schedule, (now + self.interval, key))
+            else:
+                del self.tracked[key]
+        self.archive.save_series(updated)
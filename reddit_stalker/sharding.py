@@ -0,0 +1,296 @@
+import bisect
+import hashlib
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import praw
+from prawcore.exceptions import PrawcoreException
+from .accounts import AccountPool
+from .capture import CaptureLog, capturing
+from .cassette import CassetteExhausted, Player, requestor_options
+from .dedup import SeenSet, seen
+from .items import snapshot
+from .metrics import metrics
+from .users import UserTable
+
+logger = logging.getLogger(__name__)
+
+# How often workers send their metrics to the coordinator
+METRICS_INTERVAL = 10
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of usernames onto nodes, so that adding or removing a node
+    only moves the users of that node.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        self.replicas = replicas
+        self.ring = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            bisect.insort(self.ring, (_hash("%s#%d" % (node, replica)), node))
+
+    def remove(self, node):
+        self.ring = [point for point in self.ring if point[1] != node]
+
+    def node_for(self, key):
+        index = bisect.bisect(self.ring, (_hash(key.lower()), "")) % len(self.ring)
+        return self.ring[index][1]
+
+    def assign(self, keys):
+        assignments = {node: [] for _, node in self.ring}
+        for key in keys:
+            assignments[self.node_for(key)].append(key)
+        return assignments
+
+
+def shard_followings(followings, nodes, node):
+    """
+    The part of `followings` that `node` is responsible for
+    """
+    return HashRing(nodes).assign(followings).get(node, [])
+
+
+def worker_path(path, node):
+    """
+    A worker's own version of a --record/--replay cassette: cassette.gz -> cassette.worker0.gz
+    """
+    if not path:
+        return path
+    root, extension = os.path.splitext(path)
+    return "%s.%s%s" % (root, node, extension)
+
+
+def run_worker(node, site, followings, include_old, start_time, excluded_subreddits, settings, items, control, reports):
+    """
+    Stream the users of one shard with its own credentials, sending item snapshots to the coordinator.
+    A None item marks the end of the backfill; the control queue delivers new follow lists (None to stop), and the
+    worker's metrics are sent on the reports queue every METRICS_INTERVAL seconds.
+    `settings` holds the polling options of the command line (see Coordinator).
+    """
+    # Imported here to avoid an import cycle with stream.py
+    from .stream import backfill, poll_streams, update_users  # pylint: disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.WARNING)
+    seen.max_age = settings.get("seen_max_age", seen.max_age)
+    options = requestor_options(
+        worker_path(settings.get("record"), node), worker_path(settings.get("replay"), node), settings.get("replay_speed", 1.0)
+    )
+    capture = None
+    if settings.get("capture"):
+        capture = CaptureLog(settings["capture"], settings.get("capture_segment", 3600), settings.get("capture_compression"), node)
+        options = capturing(options, capture)
+    cassette = options.get("requestor_kwargs", {}).get("cassette")
+    try:
+        pool = AccountPool.single(praw.Reddit(site, **options), site)
+        users = UserTable(pool, settings.get("recheck", 6 * 3600), settings.get("quiet_interval", 0))
+        users.add(followings, include_old)
+        users.set_interval(settings.get("digest", []), settings.get("digest_interval", 0))
+
+        def emit(item):
+            items.put((node, snapshot(item)))
+
+        if include_old:
+            backfill(users, start_time, excluded_subreddits, emit)
+        items.put((node, None))
+
+        reported = 0
+        while True:
+            if isinstance(cassette, Player) and not cassette.remaining:
+                return
+            try:
+                poll_streams(pool, users, excluded_subreddits, emit, settings.get("poll_interval", 0))
+                try:
+                    while True:
+                        new_followings = control.get_nowait()
+                        if new_followings is None:
+                            return
+                        followings = update_users(users, followings, new_followings)
+                        users.set_interval(settings.get("digest", []), settings.get("digest_interval", 0))
+                except queue.Empty:
+                    pass
+                if time.time() - reported >= METRICS_INTERVAL:
+                    reports.put((node, metrics.snapshot()))
+                    reported = time.time()
+                wakeup = users.next_wakeup()
+                if wakeup is None:
+                    # No users (yet): only wait for a new follow list
+                    wakeup = time.time() + 1
+                if wakeup > time.time():
+                    time.sleep(min(wakeup - time.time(), 1))
+            except PrawcoreException:
+                logger.info("%s: Sleeping before reconnection...", node)
+                time.sleep(5)
+    except (KeyboardInterrupt, CassetteExhausted):
+        return
+    finally:
+        # Worker processes exit without running atexit handlers
+        if capture:
+            capture.close()
+        if hasattr(cassette, "close"):
+            cassette.close()
+
+
+class Coordinator:
+    """
+    Runs one worker process per shard, and merges their items into a single stream
+    ordered by creation time (within `window` seconds of reordering). `settings` are passed to every worker:
+    poll_interval, recheck, quiet_interval, seen_max_age, digest (users) and digest_interval, record, replay and
+    replay_speed (each worker has its own cassette, see worker_path()), capture, capture_segment and capture_compression
+    (each worker writes its own segments).
+    Worker metrics are merged into this process's, with a worker label. Items found by more than one
+    worker (an r/<subreddit> entry and a user posting there) are only emitted once.
+    """
+
+    def __init__(self, workers, sites, window=2.0, settings=None):
+        self.context = multiprocessing.get_context("spawn")
+        self.nodes = ["worker%d" % index for index in range(workers)]
+        self.sites = {node: sites[index % len(sites)] for index, node in enumerate(self.nodes)}
+        self.ring = HashRing(self.nodes)
+        self.window = window
+        self.settings = settings or {}
+        self.seen = SeenSet(self.settings.get("seen_max_age", seen.max_age))
+        self.items = self.context.Queue()
+        self.reports = self.context.Queue()
+        self.processes = {}
+        self.controls = {}
+        self.assignments = {}
+        self.pending = []
+        self.sequence = itertools.count()
+
+    def start(self, followings, include_old, start_time, excluded_subreddits):
+        self.assignments = self.ring.assign(followings)
+        for node in self.nodes:
+            logger.info("Starting %s (site %s) with %d users", node, self.sites[node], len(self.assignments[node]))
+            self.controls[node] = self.context.Queue()
+            self.processes[node] = self.context.Process(
+                target=run_worker,
+                name=node,
+                args=(
+                    node,
+                    self.sites[node],
+                    self.assignments[node],
+                    include_old,
+                    start_time,
+                    excluded_subreddits,
+                    self.settings,
+                    self.items,
+                    self.controls[node],
+                    self.reports,
+                ),
+                daemon=True,
+            )
+            self.processes[node].start()
+
+    def reassign(self, followings):
+        """
+        Send each worker its new follow list; only workers whose share changed are told
+        """
+        assignments = self.ring.assign(followings)
+        for node, users in assignments.items():
+            if sorted(users) != sorted(self.assignments.get(node, [])):
+                self.controls[node].put(users)
+        self.assignments = assignments
+
+    def _new(self, item):
+        if item.name in self.seen:
+            return False
+        self.seen.add(item.name)
+        return True
+
+    def collect_metrics(self):
+        try:
+            while True:
+                node, report = self.reports.get_nowait()
+                metrics.merge(report, worker=node)
+        except queue.Empty:
+            pass
+
+    def check_workers(self):
+        for node, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            del self.processes[node]
+            if process.exitcode == 0:
+                # Done replaying its cassette
+                logger.info("%s finished", node)
+                continue
+            logger.error("%s exited with code %s, moving its users to the other workers", node, process.exitcode)
+            self.ring.remove(node)
+            if not self.processes:
+                raise RuntimeError("All workers exited")
+            self.reassign([user for users in self.assignments.values() for user in users])
+
+    def backfill(self, emit):
+        """
+        Wait for every worker to finish its backfill, then emit everything in order
+        """
+        waiting = set(self.processes)
+        all_items = []
+        while waiting:
+            try:
+                node, item = self.items.get(timeout=1)
+            except queue.Empty:
+                self.check_workers()
+                waiting &= set(self.processes)
+                continue
+            if item is None:
+                waiting.discard(node)
+            elif self._new(item):
+                all_items.append(item)
+        for item in sorted(all_items, key=lambda item: item.created_utc):
+            emit(item)
+
+    def _receive(self, timeout):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                _, item = self.items.get(timeout=max(0, deadline - time.time()))
+                if item is not None and self._new(item):
+                    heapq.heappush(self.pending, (item.created_utc, next(self.sequence), time.time(), item))
+            except queue.Empty:
+                break
+
+    def poll(self, emit, timeout=1.0):
+        """
+        Collect items for up to `timeout` seconds, and emit those that have waited out the reordering window
+        """
+        self._receive(timeout)
+        now = time.time()
+        while self.pending and self.pending[0][2] + self.window <= now:
+            emit(heapq.heappop(self.pending)[3])
+        self.collect_metrics()
+        self.check_workers()
+
+    def flush(self, emit):
+        """
+        Emit everything received, without waiting out the reordering window (once the workers have stopped)
+        """
+        self._receive(0.1)
+        while self.pending:
+            emit(heapq.heappop(self.pending)[3])
+
+    def stop(self, timeout=5):
+        """
+        Ask the workers to stop (so that they close their cassettes and captures), terminating those that don't
+        """
+        for node in self.processes:
+            self.controls[node].put(None)
+        deadline = time.time() + timeout
+        for process in self.processes.values():
+            process.join(max(0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
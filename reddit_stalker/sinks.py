@@ -0,0 +1,357 @@
+"""
+Output sinks. Every item is wrapped once in an Entry, whose record, JSON and text renderings are computed
+on first use and shared by all the sinks; edits, deletions and digests are Events, which sinks write like items.
+Sinks other than the terminal run in their own thread, behind a bounded queue, and receive entries in batches.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import http.client
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.parse
+from .archive import Archive
+from .items import to_record
+from .metrics import metrics
+from .profiling import span
+
+logger = logging.getLogger(__name__)
+
+ANSI = re.compile(r"\x1b\[[0-9;]*m")
+SEPARATOR = "=================="
+# Webhook retries wait 1s, 2s, 4s... (with jitter), at most a minute
+BACKOFF = 1
+MAX_BACKOFF = 60
+
+
+class Entry:
+    def __init__(self, item, render):
+        self.item = item
+        self.render = render
+
+    @functools.cached_property
+    def record(self):
+        return to_record(self.item)
+
+    @functools.cached_property
+    def json(self):
+        return json.dumps(self.record)
+
+    @functools.cached_property
+    def text(self):
+        return self.render(self.item)
+
+    @functools.cached_property
+    def plain_text(self):
+        return ANSI.sub("", self.text)
+
+
+class Event(Entry):
+    """
+    Something other than an item (an edit, a deletion, a digest), given as its record and text
+    """
+
+    def __init__(self, record, text):
+        super().__init__(None, None)
+        self.record = record
+        self.text = text
+
+
+class TerminalSink:
+    """
+    Prints items as they come, in the main thread (so that it never interleaves with the other terminal output)
+    """
+
+    name = "terminal"
+
+    def write(self, entries):
+        with span("render"):
+            for entry in entries:
+                print(entry.text)
+                print(SEPARATOR)
+
+
+class FileSink:
+    """
+    Appends items to a file, as text (without colors) or as JSON lines. When the file grows over `max_bytes`,
+    it is renamed to <path>.1 (and <path>.1 to <path>.2...), keeping `backups` old files.
+    """
+
+    def __init__(self, path, as_json=False, max_bytes=100 * 2**20, backups=5):
+        self.name = ("ndjson:" if as_json else "file:") + path
+        self.path = path
+        self.as_json = as_json
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = None
+
+    def _rotate(self):
+        self.file.close()
+        self.file = None
+        for number in range(self.backups - 1, 0, -1):
+            if os.path.exists("%s.%d" % (self.path, number)):
+                os.replace("%s.%d" % (self.path, number), "%s.%d" % (self.path, number + 1))
+        if self.backups:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+    def write(self, entries):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+        for entry in entries:
+            self.file.write(entry.json + "\n" if self.as_json else entry.plain_text + "\n" + SEPARATOR + "\n")
+        self.file.flush()
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            self._rotate()
+
+
+class SqliteSink:
+    """
+    Stores items in an archive database (see archive.py), opened in the sink's thread. Events are left out.
+    """
+
+    def __init__(self, path):
+        self.name = "sqlite:" + path
+        self.path = path
+        self.archive = None
+
+    def write(self, entries):
+        if self.archive is None:
+            self.archive = Archive(self.path)
+        self.archive([entry.item for entry in entries if entry.item is not None])
+
+
+class WebhookSink:
+    """
+    POSTs each batch as a JSON array of records, over keep-alive connections (one per concurrent batch, up to
+    `concurrency`). Failed requests (connection errors, 429 and 5xx) are retried with exponential backoff;
+    batches that still can't be delivered go to the `spool` file (dropped without one), as do all batches
+    while the endpoint is known to be down. The spool is sent first once the endpoint answers again.
+    """
+
+    def __init__(self, url, concurrency=4, retries=5, spool=None, timeout=10):
+        self.name = "webhook:" + url
+        self.url = urllib.parse.urlsplit(url)
+        self.retries = retries
+        self.spool = spool
+        self.timeout = timeout
+        self.connections = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.spool_lock = threading.Lock()
+        self.down_until = 0
+
+    def _connection(self):
+        try:
+            return self.connections.get_nowait()
+        except queue.Empty:
+            connection_class = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+            return connection_class(self.url.netloc, timeout=self.timeout)
+
+    def _post(self, body):
+        """
+        One attempt: returns None on success, otherwise the number of seconds to wait before retrying
+        (or raises ValueError if retrying is pointless)
+        """
+        connection = self._connection()
+        try:
+            path = self.url.path + ("?" + self.url.query if self.url.query else "")
+            connection.request("POST", path or "/", body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as ex:
+            connection.close()
+            logger.debug("POST to %s failed: %s", self.name, ex)
+            return 0
+        self.connections.put(connection)
+        metrics.inc("reddit_stalker_webhook_requests_total", doc="Webhook POSTs", status=str(response.status))
+        if response.status < 300:
+            return None
+        if response.status == 429 or response.status >= 500:
+            try:
+                return float(response.getheader("Retry-After") or 0)
+            except ValueError:
+                return 0
+        raise ValueError("HTTP %d" % response.status)
+
+    def _send(self, body):
+        """
+        POST with retries; returns whether the batch was delivered
+        """
+        wait = 0
+        with self.slots:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(min(MAX_BACKOFF, max(wait, BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))))
+                try:
+                    wait = self._post(body)
+                except ValueError as ex:
+                    logger.warning("%s rejected a batch (%s), dropping it", self.name, ex)
+                    return True
+                if wait is None:
+                    return True
+            self.down_until = time.time() + MAX_BACKOFF
+            return False
+
+    def _spool(self, body, count):
+        if not self.spool:
+            logger.warning("Couldn't send %d items to %s", count, self.name)
+            metrics.inc("reddit_stalker_sink_dropped_total", count, doc="Items a sink couldn't take", sink=self.name)
+            return
+        with self.spool_lock, open(self.spool, "ab") as f:
+            f.write(body + b"\n")
+        metrics.inc("reddit_stalker_webhook_spooled_total", count, doc="Items spooled to disk while the webhook is down")
+
+    def _unspool(self):
+        """
+        Send the spooled batches, oldest first, keeping those that fail
+        """
+        with self.spool_lock:
+            try:
+                with open(self.spool, "rb") as f:
+                    bodies = f.read().splitlines()
+            except FileNotFoundError:
+                return
+            os.remove(self.spool)
+        logger.info("Sending %d spooled batches to %s", len(bodies), self.name)
+        for number, body in enumerate(bodies):
+            if not self._send(body):
+                for remaining in bodies[number:]:
+                    self._spool(remaining, len(json.loads(remaining)))
+                return
+
+    def write(self, entries):
+        body = ("[" + ",".join(entry.json for entry in entries) + "]").encode("utf-8")
+        if time.time() < self.down_until or not self._send(body):
+            self._spool(body, len(entries))
+        elif self.spool and os.path.exists(self.spool):
+            self._unspool()
+
+
+class QueuedSink:
+    """
+    Runs a sink in its own threads (`workers` of them, for sinks that can write batches concurrently), handing
+    them batches of up to `batch_size` entries (or what arrived within `max_delay` seconds). When the queue is
+    full, new entries are dropped rather than slowing everyone down.
+    """
+
+    def __init__(self, sink, size=10000, batch_size=100, max_delay=1.0, workers=1):
+        self.sink = sink
+        self.name = sink.name
+        self.queue = queue.Queue(size)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.threads = [threading.Thread(target=self._run, name=self.name, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def write(self, entries):
+        for entry in entries:
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                metrics.inc("reddit_stalker_sink_dropped_total", doc="Items a sink couldn't take", sink=self.name)
+        metrics.set("reddit_stalker_sink_queue", self.queue.qsize(), doc="Items waiting for a sink", sink=self.name)
+
+    def _batch(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.max_delay
+        # A None entry tells one thread to stop
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self.queue.get(timeout=max(0, deadline - time.time())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._batch()
+            entries = [entry for entry in batch if entry is not None]
+            try:
+                if entries:
+                    self.sink.write(entries)
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.warning("Sink %s failed: %s", self.name, ex)
+            for _ in batch:
+                self.queue.task_done()
+            if None in batch:
+                return
+
+    def close(self, timeout=5):
+        """
+        Let the sink write what is queued (for up to `timeout` seconds)
+        """
+        deadline = time.time() + timeout
+        try:
+            for _ in self.threads:
+                self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.time()))
+
+
+def make_sink(spec, webhook_concurrency=4, webhook_batch=100, webhook_retries=5, webhook_spool=None):
+    """
+    terminal, file:<path>, ndjson:<path>, sqlite:<path> or webhook:<url>
+    """
+    kind, _, target = spec.partition(":")
+    if kind == "terminal":
+        return TerminalSink()
+    if not target:
+        raise ValueError("%s needs a target: %s:<...>" % (kind, kind))
+    if kind in ("file", "ndjson"):
+        return QueuedSink(FileSink(target, as_json=kind == "ndjson"))
+    if kind == "sqlite":
+        return QueuedSink(SqliteSink(target))
+    if kind == "webhook":
+        sink = WebhookSink(target, webhook_concurrency, webhook_retries, webhook_spool)
+        return QueuedSink(sink, batch_size=webhook_batch, workers=webhook_concurrency)
+    raise ValueError("Unknown output %s" % spec)
+
+
+def make_sinks(specs, webhook_concurrency=4, webhook_batch=100, webhook_retries=5, webhook_spool=None):
+    """
+    The sinks of all the --output specs. With several webhooks, each one spools to <spool>.<hash of its URL>,
+    so that it never sends the batches of another.
+    """
+    webhooks = [spec for spec in specs if spec.startswith("webhook:")]
+    sinks = []
+    for spec in specs:
+        spool = webhook_spool
+        if spool and len(webhooks) > 1 and spec in webhooks:
+            spool = "%s.%s" % (spool, hashlib.sha1(spec.encode("utf-8")).hexdigest()[:8])
+        sinks.append(make_sink(spec, webhook_concurrency, webhook_batch, webhook_retries, spool))
+    return sinks
+
+
+class Outputs:
+    """
+    Fans every item (and event) out to all the sinks
+    """
+
+    def __init__(self, sinks, render):
+        self.sinks = sinks
+        self.render = render
+
+    def __call__(self, item):
+        entry = Entry(item, self.render)
+        for sink in self.sinks:
+            sink.write([entry])
+
+    def event(self, record, text):
+        entry = Event(record, text)
+        for sink in self.sinks:
+            sink.write([entry])
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
@@ -3,16 +3,45 @@ import dateparser
 import datetime
 import logging
 import praw
-from prawcore.exceptions import PrawcoreException
+from prawcore.exceptions import Forbidden, InvalidToken, NotFound, OAuthException, PrawcoreException, Redirect
 import sys
 import random
+import re
 import socket
 import time
 from ._version import get_versions
-from colorama import init, Fore, Style
+from .classify import Classifier
+from .digest import Digest
+from .enrich import Enricher
+from .followings import FollowList, diff_followings, validate_subreddits
+from .accounts import AccountPool
+from .capture import CaptureLog, capturing
+from .cassette import CassetteExhausted, requestor_options
+from .tracker import EditTracker
+from .archive import Archive
+from .plugins import Plugins
+from .series import ScoreTracker
+from .sinks import Outputs, make_sinks
+from .stats import main as stats_main
+from .watch import Watcher
+from .sharding import Coordinator, shard_followings
+from .dedup import seen
+from .items import item_url, read_list, snapshot, to_record
+from .memory import MemoryBudget
+from .pipeline import Pipeline
+from .users import UserTable, source_name
+from .metrics import metrics, LAG_BUCKETS, serve as serve_metrics
+from .profiling import record_span, span, start_profiling
+from colorama import init, Back, Fore, Style
 
 logger = logging.getLogger(__name__)
 
+# How far back the --archive is read to learn when users are active
+ACTIVITY_HISTORY = 8 * 7 * 86400
+DIGEST_WINDOWS = {"hourly": 3600, "daily": 86400}
+# Errors of the listings of an inaccessible account or subreddit (reddit redirects missing subreddits to a search)
+INACCESSIBLE = (Forbidden, NotFound, Redirect)
+
 
 def receive_connection():
     """
@@ -36,25 +65,43 @@ def send_message(client, message):
     client.close()
 
 
-def print_item(item, subreddit_cache):
-    try:
-        assert subreddit_cache[item.subreddit_id]
-    except KeyError:
-        subreddit_cache[item.subreddit_id] = item.subreddit_name_prefixed
-    try:
-        url = "https://www.reddit.com/comments/%s/_/%s/" % (item.link_id.replace("t3_", ""), item.id)
+def is_excluded(item, excluded_subreddits):
+    if item.subreddit.display_name.lower() in excluded_subreddits:
+        metrics.inc("reddit_stalker_filtered_total", doc="Items dropped by filters", reason="subreddit")
+        return True
+    return False
+
+
+def format_item(item, subreddit_cache, watcher=None):
+    """
+    The terminal rendering of an item. Runs in the sink threads too: only reads `subreddit_cache`.
+    """
+    # Only look at what the listing (or enrichment) provided: praw fetches missing attributes, one request per item
+    data = vars(item)
+    url = item_url(item)
+    if "link_id" in data:
         action = "commented"
+        if data.get("link_title"):
+            action = "commented on " + Style.BRIGHT + data["link_title"] + Style.NORMAL
         content = item.body
-    except AttributeError:
-        url = "https://www.reddit.com/%s/" % item.id
+    else:
         try:
-            action = "crossposted from " + Fore.BLUE + item.crosspost_parent_list[0]["subreddit_name_prefixed"] + Fore.RESET
-        except (AttributeError, KeyError):
+            action = "crossposted from " + Fore.BLUE + data["crosspost_parent_list"][0]["subreddit_name_prefixed"] + Fore.RESET
+        except (KeyError, IndexError, TypeError):
             action = "posted"
         content = item.title
         if item.selftext:
             content = content + "\n" + item.selftext
-    print(
+    if watcher and data.get("watch_matches"):
+        content = watcher.highlight(content, Back.YELLOW + Fore.BLACK, Style.RESET_ALL)
+    if data.get("annotations"):
+        content += (
+            "\n"
+            + Style.DIM
+            + " ".join("%s=%s" % annotation for annotation in sorted(data["annotations"].items(), key=str))
+            + Style.RESET_ALL
+        )
+    return (
         Style.DIM
         + datetime.datetime.fromtimestamp(item.created_utc).isoformat()
         + Style.RESET_ALL
@@ -64,7 +111,7 @@ def print_item(item, subreddit_cache):
         + Fore.RESET
         + "\n"
         + Fore.BLUE
-        + subreddit_cache[item.subreddit_id]
+        + subreddit_cache.get(item.subreddit_id, item.subreddit_name_prefixed)
         + Fore.RESET
         + " "
         + Fore.RED
@@ -75,12 +122,232 @@ def print_item(item, subreddit_cache):
         + ": "
         + content
     )
-    print("==================")
-    with open("/tmp/reddit_stalker_last_timestamp", "w") as f:
+
+
+def format_change(event, item, diff, subreddit_cache):
+    """
+    An edit (with a diff of the text) or deletion reported by the edit tracker
+    """
+    kind = "comment" if "link_id" in vars(item) else "post"
+    content = Fore.YELLOW + "deleted this %s" % kind + Fore.RESET
+    if event == "edited":
+        lines = [
+            (Fore.GREEN if line.startswith("+") else Fore.RED if line.startswith("-") else Style.DIM) + line + Style.RESET_ALL
+            for line in diff.splitlines()
+        ]
+        content = Fore.YELLOW + "edited this %s" % kind + Fore.RESET + ":\n" + "\n".join(lines)
+    return (
+        Style.DIM
+        + datetime.datetime.now().isoformat()
+        + Style.RESET_ALL
+        + Fore.BLUE
+        + " "
+        + item_url(item)
+        + Fore.RESET
+        + "\n"
+        + Fore.BLUE
+        + subreddit_cache.get(item.subreddit_id, item.subreddit_name_prefixed)
+        + Fore.RESET
+        + " "
+        + Fore.RED
+        + str(item.author)
+        + Fore.RESET
+        + " "
+        + content
+    )
+
+
+def format_digest(started, digest):
+    """
+    One summary per user for a --digest window
+    """
+    lines = [Style.BRIGHT + "Digest since " + datetime.datetime.fromtimestamp(started).isoformat() + Style.RESET_ALL]
+    for author, count, subreddits, top in digest:
+        lines.append(
+            Fore.RED
+            + author
+            + Fore.RESET
+            + ": %d item%s in " % (count, "" if count == 1 else "s")
+            + ", ".join(Fore.BLUE + subreddit + Fore.RESET + " (%d)" % subreddit_count for subreddit, subreddit_count in subreddits)
+        )
+        for item in top:
+            lines.append(
+                "  "
+                + Style.DIM
+                + "[%s]" % item["score"]
+                + Style.RESET_ALL
+                + " "
+                + item["text"]
+                + (Fore.BLUE + " https://www.reddit.com" + item["permalink"] + Fore.RESET if item["permalink"] else "")
+            )
+    return "\n".join(lines)
+
+
+def digest_record(started, digest):
+    return {
+        "event": "digest",
+        "started": started,
+        "users": [
+            {
+                "author": author,
+                "items": count,
+                "subreddits": [{"subreddit": subreddit, "items": subreddit_count} for subreddit, subreddit_count in subreddits],
+                "top": top,
+            }
+            for author, count, subreddits, top in digest
+        ],
+    }
+
+
+def save_checkpoint(item):
+    with span("checkpoint"), open("/tmp/reddit_stalker_last_timestamp", "w") as f:
         f.write(str(item.created_utc))
 
 
+def update_users(users, followings, new_followings):
+    """
+    Start polling newly followed users and stop polling unfollowed users, leaving the others untouched
+    """
+    added, removed = diff_followings(followings, new_followings)
+    users.remove(removed)
+    users.add(added)
+    if added or removed:
+        logger.info("Started following %s, stopped following %s", added, removed)
+    metrics.set("reddit_stalker_followed_users", len(new_followings), doc="Number of followed users")
+    return [following for following in followings if following not in removed] + added
+
+
+def backfill(users, start_time, excluded_subreddits, emit, budget=None):
+    """
+    For the initial stream, sort the comments and submissions by time.
+    Items are buffered as snapshots; if that goes over the memory budget, what was collected so far is emitted early.
+    """
+    all_items = []
+    for label, stream in users.items():
+        logger.debug("Looking at stream %s", label)
+        try:
+            for item in stream:
+                if item is not None:
+                    with span("filter"):
+                        excluded = is_excluded(item, excluded_subreddits)
+                    if excluded:
+                        continue
+                    if item.created_utc >= start_time:
+                        logger.debug("Adding item %s", item)
+                        all_items.append(snapshot(item))
+                else:
+                    break
+        except INACCESSIBLE as ex:
+            users.park(source_name(label), ex)
+        if budget and budget.exceeded():
+            logger.warning(
+                "Backfill is over the memory budget, emitting %d items early (order is only kept per batch)", len(all_items)
+            )
+            for item in sorted(all_items, key=lambda item: item.created_utc):
+                emit(item)
+            all_items = []
+    logger.info("Finished")
+    for item in sorted(all_items, key=lambda item: item.created_utc):
+        emit(item)
+
+
+def poll_streams(pool, users, excluded_subreddits, emit, interval=0):
+    """
+    Do one round over the streams of all due users, passing each new item to emit()
+    """
+    for label, stream in users.items(interval):
+        kind = label.rsplit("/", 1)[1]
+        started = time.time()
+        try:
+            # Streams only hit the API at the start of a round, and yield None at the end of it
+            item = next(stream)
+            latency = time.time() - started
+            record_span("fetch", latency)
+            while item is not None:
+                with span("filter"):
+                    excluded = is_excluded(item, excluded_subreddits)
+                if not excluded:
+                    emit(item)
+                    metrics.inc("reddit_stalker_items_total", doc="Items emitted", stream=label)
+                    metrics.observe(
+                        "reddit_stalker_lag_seconds",
+                        time.time() - item.created_utc,
+                        buckets=LAG_BUCKETS,
+                        doc="Delay between an item's creation and its output",
+                    )
+                item = next(stream)
+        except (InvalidToken, OAuthException):
+            pool.fail(source_name(label))
+            # Polled again once rebalanced onto a working account, or when the failed accounts are retried
+            users.schedule(source_name(label), pool.next_available())
+            continue
+        except INACCESSIBLE as ex:
+            users.park(source_name(label), ex)
+            continue
+        logger.debug("No items for %s", label)
+        metrics.inc("reddit_stalker_polls_total", doc="Listing requests per stream", stream=label)
+        metrics.observe("reddit_stalker_poll_duration_seconds", latency, doc="Listing request latency", kind=kind)
+    pool.update_rate_limits()
+    metrics.set("reddit_stalker_seen_items", len(seen), doc="Fullnames in the shared seen set")
+
+
+def back_off():
+    logger.info("Sleeping before reconnection...")
+    metrics.inc("reddit_stalker_backoffs_total", doc="Reconnection back-offs after API errors")
+    metrics.set("reddit_stalker_backoff", 1, doc="1 while sleeping before reconnection")
+    time.sleep(5)
+    metrics.set("reddit_stalker_backoff", 0, doc="1 while sleeping before reconnection")
+
+
+def stream_sharded(
+    args, load_followings, follow_list, followings, include_old, start_time, excluded_subreddits, pipeline, periodic_tasks
+):  # pylint: disable=too-many-arguments
+    settings = {
+        "poll_interval": args.poll_interval,
+        "recheck": args.dead_recheck * 3600,
+        "quiet_interval": args.quiet_interval,
+        "seen_max_age": args.seen_max_age * 3600,
+        "digest": args.digest or [],
+        "digest_interval": args.digest_interval,
+        "record": args.record,
+        "replay": args.replay,
+        "replay_speed": args.replay_speed,
+        "capture": args.capture,
+        "capture_segment": args.capture_segment * 60,
+        "capture_compression": args.capture_compression,
+    }
+    coordinator = Coordinator(args.workers, args.sites, args.merge_window, settings)
+    coordinator.start(followings, include_old, start_time, excluded_subreddits)
+    try:
+        if include_old:
+            logger.info("Getting old items since %s", args.include_old_actions)
+            coordinator.backfill(pipeline)
+            pipeline.flush()
+        logger.info("Starting streaming")
+        # Workers only exit by themselves once they have replayed their cassette
+        while coordinator.processes:
+            try:
+                coordinator.poll(pipeline)
+                pipeline.flush()
+                periodic_tasks()
+                if follow_list.changed():
+                    followings = load_followings()
+                    metrics.set("reddit_stalker_followed_users", len(followings), doc="Number of followed users")
+                    coordinator.reassign(followings)
+            except PrawcoreException:
+                back_off()
+    except (KeyboardInterrupt, CassetteExhausted):
+        pass
+    finally:
+        coordinator.stop()
+        coordinator.flush(pipeline)
+    return 0
+
+
 def main():  # pylint: disable=too-many-branches,too-many-statements
+    if sys.argv[1:2] == ["stats"]:
+        return stats_main(sys.argv[2:])
+
     init()
 
     parser = argparse.ArgumentParser()
@@ -96,6 +363,13 @@ def main():  # pylint: disable=too-many-branches,too-many-statements
     )
     parser.add_argument("-m", "--follow-me", help="Include your own comments and submissions", action="store_true")
     parser.add_argument("-f", "--followers", help="Automatically track all users you're following", action="store_true")
+    parser.add_argument(
+        "--followers-refresh",
+        type=float,
+        default=60,
+        metavar="minutes",
+        help="How often to check for users you started or stopped following with --followers (0 to disable)",
+    )
     parser.add_argument(
         "-u",
         "--users",
@@ -103,6 +377,18 @@ def main():  # pylint: disable=too-many-branches,too-many-statements
         metavar="username",
         help="List of users to follow in addition to the users you follow (aka stealth mode)",
     )
+    parser.add_argument(
+        "--users-file",
+        metavar="path",
+        help="File with one user to follow per line. Changes are picked up without restarting (as is SIGHUP)",
+    )
+    parser.add_argument(
+        "--subreddits",
+        nargs="+",
+        metavar="subreddit",
+        help="Also stream new comments and submissions of these subreddits (items also posted by followed users "
+        "are only shown once)",
+    )
     parser.add_argument(
         "-x",
         "--exclude-subreddits",
@@ -110,16 +396,225 @@ def main():  # pylint: disable=too-many-branches,too-many-statements
         nargs="+",
         help="List of subreddits to exclude (in case you monitor r/foo/comments, for example)",
     )
+    parser.add_argument(
+        "--metrics-port", type=int, metavar="port", help="Serve Prometheus metrics on http://localhost:<port>/metrics"
+    )
+    parser.add_argument("--profile", choices=["cpu", "mem"], help="Profile CPU (cProfile) or memory (tracemalloc) usage")
+    parser.add_argument(
+        "--profile-output",
+        metavar="path",
+        help="Where to write the profile (default: /tmp/reddit_stalker.prof or /tmp/reddit_stalker.snapshot). "
+        "Also written on SIGUSR1",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=int,
+        default=60,
+        metavar="seconds",
+        help="How often to log the top memory allocators with --profile mem (0 to only report on exit/SIGUSR1)",
+    )
+    parser.add_argument(
+        "--sites",
+        nargs="+",
+        default=["bot"],
+        metavar="site",
+        help="praw.ini sites to use as a credentials pool (the first one is used for setup and --followers)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Split the followed users across N worker processes by consistent hashing, cycling through --sites for "
+        "their credentials, and merge their output",
+    )
+    parser.add_argument(
+        "--merge-window",
+        type=float,
+        default=2.0,
+        metavar="seconds",
+        help="How long --workers output is held back to order it by creation time",
+    )
+    parser.add_argument(
+        "--shard-nodes",
+        nargs="+",
+        metavar="node",
+        help="Names of all the hosts sharing the follow list (use with --shard-node)",
+    )
+    parser.add_argument("--shard-node", metavar="node", help="Only follow the users that --shard-nodes assigns to this host")
+    parser.add_argument(
+        "--seen-max-age",
+        type=float,
+        default=48,
+        metavar="hours",
+        help="How long seen items are remembered for deduplication (items older than this are ignored when streaming)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=0,
+        metavar="seconds",
+        help="Minimum time between two polls of the same user (default: poll continuously)",
+    )
+    parser.add_argument(
+        "--quiet-interval",
+        type=float,
+        default=0,
+        metavar="seconds",
+        help="Learn at which hours of the week each user is usually active (from their items, and the --archive), "
+        "and poll them only this often when they usually aren't",
+    )
+    parser.add_argument(
+        "--dead-recheck",
+        type=float,
+        default=6,
+        metavar="hours",
+        help="How long to wait before polling suspended, deleted or otherwise inaccessible accounts again",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        metavar="MiB",
+        help="Keep resident memory under this size by dropping caches, and by flushing the backfill early if needed",
+    )
+    parser.add_argument(
+        "--track-edits",
+        type=float,
+        default=0,
+        metavar="hours",
+        help="Re-check items for this long after their creation, and report edits and deletions (0 to disable)",
+    )
+    parser.add_argument(
+        "--watch",
+        nargs="+",
+        metavar="term",
+        help="Highlight these keywords (matched as whole words, case-insensitively) or /regexes/ in items",
+    )
+    parser.add_argument("--watch-file", metavar="path", help="File with one --watch term per line")
+    parser.add_argument(
+        "--watch-alerts", metavar="path", help="Also append items matching a watch term to this file, as JSON lines"
+    )
+    parser.add_argument("--classify", action="store_true", help="Tag items with their language, sentiment and toxicity (offline)")
+    parser.add_argument(
+        "--languages", nargs="+", metavar="code", help="Only show items in these languages (ISO 639-1; implies --classify)"
+    )
+    parser.add_argument(
+        "--min-sentiment", type=float, metavar="score", help="Hide items more negative than this (-1 to 1; implies --classify)"
+    )
+    parser.add_argument(
+        "--max-toxicity", type=float, metavar="score", help="Hide items more toxic than this (0 to 1; implies --classify)"
+    )
+    parser.add_argument(
+        "--digest",
+        nargs="+",
+        metavar="username",
+        help="Follow these users, but only show a periodic summary of their activity, and poll them every --digest-interval",
+    )
+    parser.add_argument("--digest-window", choices=sorted(DIGEST_WINDOWS), default="hourly", help="How often the --digest is shown")
+    parser.add_argument(
+        "--digest-interval",
+        type=float,
+        default=900,
+        metavar="seconds",
+        help="Minimum time between two polls of a --digest user",
+    )
+    parser.add_argument(
+        "--output",
+        nargs="+",
+        default=["terminal"],
+        metavar="sink",
+        help="Where items go: terminal, file:<path> (rotated at 100 MB), ndjson:<path> (JSON lines, rotated too), "
+        "sqlite:<path> or webhook:<url> (POSTs JSON arrays of items)",
+    )
+    parser.add_argument(
+        "--webhook-concurrency", type=int, default=4, metavar="N", help="Maximum number of concurrent webhook requests"
+    )
+    parser.add_argument("--webhook-batch", type=int, default=100, metavar="N", help="Maximum number of items per webhook request")
+    parser.add_argument(
+        "--webhook-retries", type=int, default=5, metavar="N", help="How many times a failed webhook request is retried"
+    )
+    parser.add_argument(
+        "--webhook-spool",
+        metavar="path",
+        help="Keep the items that couldn't be sent to the webhook in this file, and send them once it is back up",
+    )
+    parser.add_argument(
+        "--plugins",
+        nargs="*",
+        metavar="plugin",
+        help="Run these installed plugins (all of them if none are given) on every item, in worker processes",
+    )
+    parser.add_argument("--plugin-workers", type=int, metavar="N", help="Number of plugin worker processes (default: one per CPU)")
+    parser.add_argument(
+        "--plugin-timeout",
+        type=float,
+        default=60,
+        metavar="seconds",
+        help="Output items without their plugin annotations if the plugins take longer than this",
+    )
+    parser.add_argument("--archive", metavar="path", help="Also store every item in this SQLite database")
+    parser.add_argument(
+        "--track-scores",
+        type=float,
+        default=0,
+        metavar="hours",
+        help="Sample the score and number of comments of items every 15 minutes for this long, into the --archive",
+    )
+    parser.add_argument("--record", metavar="cassette", help="Record API responses (except OAuth) to a gzipped cassette file")
+    parser.add_argument("--replay", metavar="cassette", help="Replay API responses from a cassette instead of contacting reddit")
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        metavar="factor",
+        help="Replay at this multiple of the recorded speed (0: as fast as possible)",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="directory",
+        help="Keep the raw JSON of every comment and submission fetched, in compressed segments with an index",
+    )
+    parser.add_argument(
+        "--capture-segment", type=float, default=60, metavar="minutes", help="How long each --capture segment covers"
+    )
+    parser.add_argument(
+        "--capture-compression",
+        choices=["zstd", "gzip"],
+        help="Compression of the --capture segments (default: zstd if the zstandard package is installed, else gzip)",
+    )
     parser.add_argument("-V", "--version", action="version", version="%(prog)s {version}".format(version=get_versions()["version"]))
     args = parser.parse_args()
+    if args.track_scores and not args.archive:
+        parser.error("--track-scores needs --archive")
+    if bool(args.shard_node) != bool(args.shard_nodes):
+        parser.error("--shard-node and --shard-nodes go together")
+    if args.shard_node and args.shard_node not in args.shard_nodes:
+        parser.error("--shard-node %s isn't one of the --shard-nodes" % args.shard_node)
 
     levels = [logging.WARNING, logging.INFO, logging.DEBUG]
     level = levels[min(len(levels) - 1, args.verbose)]
     logging.basicConfig(level=level)
     logging.getLogger("prawcore").setLevel(logging.ERROR)
 
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    if args.profile:
+        start_profiling(args.profile, args.profile_output, args.profile_interval)
+
+    capture = None
+    if args.capture:
+        try:
+            capture = CaptureLog(args.capture, args.capture_segment * 60, args.capture_compression)
+        except ValueError as ex:
+            parser.error(str(ex))
+
+    # Shared by all the accounts, so that they record to (or replay from) the same cassette
+    reddit_options = requestor_options(args.record, args.replay, args.replay_speed)
+    if capture:
+        reddit_options = capturing(reddit_options, capture)
+
     try:
-        reddit = praw.Reddit("bot", redirect_uri="http://localhost:8812")
+        reddit = praw.Reddit(args.sites[0], redirect_uri="http://localhost:8812", **reddit_options)
     except praw.exceptions.ClientException:
         logger.error("Can't connect to reddit via PRAW. Did you set up a praw.ini?")
         sys.exit(1)
@@ -153,27 +648,32 @@ def main():  # pylint: disable=too-many-branches,too-many-statements
             print(refresh_token)
             return 0
 
+    seen.max_age = args.seen_max_age * 3600
     subreddit_cache = {}
-    followings = []
-    assert args.followers or args.users
-
-    if args.followers:
-        logger.info("Getting a list of users you are following")
-        followings.extend(
-            [
-                following.display_name.replace("u_", "")
-                for following in reddit.user.subreddits()
-                if following.display_name.startswith("u_")
-            ]
-        )
-    followings.extend(args.users)
-    if args.follow_me:
-        followings.append(reddit.user.me().name)
+    excluded_subreddits = {subreddit.lower() for subreddit in args.exclude_subreddits or []}
+    assert args.followers or args.users or args.users_file or args.subreddits or args.digest
+
+    follow_list = FollowList(reddit, args)
+
+    # Subreddits are polled alongside the users, as r/<name> entries
+    subreddits = validate_subreddits(reddit, {re.sub("^/?r/", "", name, flags=re.IGNORECASE) for name in args.subreddits or []})
+    subreddits = sorted(("r/" + name for name in subreddits), key=str.lower)
 
-    followings.sort(key=str.lower)
+    def load_followings():
+        followings = follow_list.load()
+        # --digest users are followed too
+        followed = {name.lower() for name in followings}
+        followings += [name for name in args.digest or [] if name.lower() not in followed] + subreddits
+        if args.shard_node:
+            return shard_followings(followings, args.shard_nodes, args.shard_node)
+        return followings
+
+    followings = load_followings()
+    metrics.set("reddit_stalker_followed_users", len(followings), doc="Number of followed users")
     logger.info("followings = %s", followings)
 
     include_old = False
+    start_time = None
     if args.include_old_actions:
         if args.include_old_actions == "auto":
             try:
@@ -186,52 +686,106 @@ def main():  # pylint: disable=too-many-branches,too-many-statements
             start_time = dateparser.parse(args.include_old_actions).timestamp()
             include_old = True
 
-    # Create streams for comments and submissions for each following user
-    streams = [
-        praw.models.Redditor(reddit, name=following).stream.comments(skip_existing=not include_old, pause_after=-1)
-        for following in followings
-    ] + [
-        praw.models.Redditor(reddit, name=following).stream.submissions(skip_existing=not include_old, pause_after=-1)
-        for following in followings
-    ]
-    logger.debug("Streams are %s", streams)
-
-    # For the initial stream, sort the comments and submissions by time
-    if args.include_old_actions:
+    watch_terms = list(args.watch or []) + (read_list(args.watch_file) if args.watch_file else [])
+    watcher = Watcher(watch_terms, args.watch_alerts) if watch_terms else None
+    try:
+        sinks = make_sinks(args.output, args.webhook_concurrency, args.webhook_batch, args.webhook_retries, args.webhook_spool)
+        outputs = Outputs(sinks, lambda item: format_item(item, subreddit_cache, watcher))
+    except ValueError as ex:
+        parser.error(str(ex))
+
+    def output(item):
+        subreddit_cache.setdefault(item.subreddit_id, item.subreddit_name_prefixed)
+        outputs(item)
+        save_checkpoint(item)
+
+    def output_change(event, item, diff):
+        record = dict(to_record(item), event=event, diff=diff)
+        outputs.event(record, format_change(event, item, diff, subreddit_cache))
+
+    enricher = Enricher(reddit)
+    tracker = EditTracker(reddit, args.track_edits * 3600) if args.track_edits else None
+    classifier = None
+    if args.classify or args.languages or args.min_sentiment is not None or args.max_toxicity is not None:
+        classifier = Classifier(args.languages, args.min_sentiment, args.max_toxicity)
+    archive = Archive(args.archive) if args.archive else None
+    scores = ScoreTracker(reddit, archive, args.track_scores * 3600) if args.track_scores else None
+    digest = Digest(reddit, args.digest, DIGEST_WINDOWS[args.digest_window]) if args.digest else None
+    plugins = Plugins(args.plugins, args.plugin_workers) if args.plugins is not None else None
+    pipeline = Pipeline(
+        # The digest takes its users' items out before the trackers: they're archived, but not re-checked
+        [stage for stage in (classifier, enricher, watcher, archive, digest, tracker, scores) if stage],
+        output,
+        deferred=plugins if plugins and plugins.names else None,
+        deferred_timeout=args.plugin_timeout,
+    )
+
+    def periodic_tasks():
+        if tracker:
+            tracker.check(output_change)
+        if scores:
+            scores.check()
+        if digest and digest.due():
+            started, users = digest.collect()
+            if users:
+                outputs.event(digest_record(started, users), format_digest(started, users))
+
+    if args.workers > 1:
+        try:
+            return stream_sharded(
+                args,
+                load_followings,
+                follow_list,
+                followings,
+                include_old,
+                start_time,
+                excluded_subreddits,
+                pipeline,
+                periodic_tasks,
+            )
+        finally:
+            pipeline.close()
+            outputs.close()
+
+    accounts = {args.sites[0]: reddit}
+    for site in args.sites[1:]:
+        accounts[site] = praw.Reddit(site, **reddit_options)
+    pool = AccountPool(accounts)
+    users = UserTable(pool, args.dead_recheck * 3600, args.quiet_interval)
+    users.add(followings, include_old)
+    users.set_interval(args.digest or [], args.digest_interval)
+    if archive and args.quiet_interval:
+        for author, created in archive.activity(time.time() - ACTIVITY_HISTORY):
+            users.observe(author, created)
+    budget = MemoryBudget(args.memory_budget) if args.memory_budget else None
+
+    if include_old:
         logger.info("Getting old items since %s", args.include_old_actions)
-        all_items = []
-        for stream in streams:
-            logger.debug("Looking at stream %s", stream)
-            for item in stream:
-                if item is not None:
-                    if item.subreddit.display_name.lower() in map(str.lower, args.exclude_subreddits):
-                        continue
-                    if item.created_utc >= start_time:
-                        logger.debug("Adding item %s", item)
-                        all_items.append(item)
-                else:
-                    break
-        logger.info("Finished")
-        for item in sorted(all_items, key=lambda item: item.created_utc):
-            print_item(item, subreddit_cache)
+        backfill(users, start_time, excluded_subreddits, pipeline, budget)
+        pipeline.flush()
 
     logger.info("Starting streaming")
     running = True
     while running:
         try:
-            for stream in streams:
-                for item in stream:
-                    if item is None:
-                        logger.debug("No items for %s", stream)
-                        break
-                    if item.subreddit.display_name.lower() in map(str.lower, args.exclude_subreddits):
-                        continue
-                    print_item(item, subreddit_cache)
-        except KeyboardInterrupt:
+            poll_streams(pool, users, excluded_subreddits, pipeline, args.poll_interval)
+            pipeline.flush()
+            periodic_tasks()
+            if follow_list.changed():
+                followings = update_users(users, followings, load_followings())
+                users.set_interval(args.digest or [], args.digest_interval)
+            pool.rebalance()
+            if budget and budget.exceeded():
+                budget.shed(seen, subreddit_cache, enricher.cache, *([tracker] if tracker else []))
+            wakeup = users.next_wakeup()
+            if wakeup and wakeup > time.time():
+                time.sleep(min(wakeup - time.time(), 1))
+        except (KeyboardInterrupt, CassetteExhausted):
             running = False
         except PrawcoreException:
-            logger.info("Sleeping before reconnection...")
-            time.sleep(5)
+            back_off()
+    pipeline.close()
+    outputs.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+import difflib
+import heapq
+import logging
+import time
+from prawcore.exceptions import PrawcoreException
+from .dedup import fullname_key, key_fullname
+from .items import BATCH_SIZE, snapshot
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# The first re-check is this long after an item is emitted; every following one waits twice as long
+FIRST_CHECK = 300
+# Once an item is due, the request is filled up with the items due within this many seconds
+SLACK = FIRST_CHECK
+DELETED = ("[deleted]", "[removed]")
+
+
+def _text(item):
+    data = vars(item)
+    return data["body"] if "link_id" in data else data.get("selftext") or ""
+
+
+def _is_deleted(thing):
+    data = vars(thing)
+    return (
+        _text(thing) in DELETED
+        or data.get("author") is None
+        or str(data.get("author")) == "[deleted]"
+        or bool(data.get("removed_by_category"))
+    )
+
+
+class EditTracker:
+    """
+    Pipeline stage remembering every item for `window` seconds after its creation, and check() re-fetching
+    the due ones with /api/info (100 per request) on a decaying schedule: 5 minutes after being emitted, then
+    10, 20, 40 minutes... Edits and deletions are reported as ("edited", item, diff) and ("deleted", item, None).
+    """
+
+    def __init__(self, reddit, window):
+        self.reddit = reddit
+        self.window = window
+        self.tracked = {}
+        # (next check, fullname key) heap; entries of items that stopped being tracked are skipped
+        self.schedule = []
+
+    def __call__(self, items):
+        now = time.time()
+        for item in items:
+            if item.created_utc + self.window <= now + FIRST_CHECK:
+                continue
+            key = fullname_key(item.name)
+            self.tracked[key] = (snapshot(item), FIRST_CHECK)
+            heapq.heappush(self.schedule, (now + FIRST_CHECK, key))
+        self._report()
+        return items
+
+    def __len__(self):
+        return len(self.tracked)
+
+    def _report(self):
+        metrics.set("reddit_stalker_tracked_items", len(self.tracked), doc="Items re-checked for edits and deletions")
+
+    def _due(self, now):
+        """
+        The next batch to re-check, if an item is due: it, and up to BATCH_SIZE items due within SLACK seconds
+        """
+        keys = []
+        if not self.schedule or self.schedule[0][0] > now:
+            return keys
+        while self.schedule and self.schedule[0][0] <= now + SLACK and len(keys) < BATCH_SIZE:
+            _, key = heapq.heappop(self.schedule)
+            if key in self.tracked and key not in keys:
+                keys.append(key)
+        return keys
+
+    def check(self, emit):
+        """
+        Re-fetch the items that are due, calling emit(event, item, diff) for every change
+        """
+        now = time.time()
+        keys = self._due(now)
+        while keys:
+            self._check_batch(keys, emit, now)
+            keys = self._due(now)
+        self._report()
+
+    def _check_batch(self, keys, emit, now):
+        metrics.inc("reddit_stalker_tracker_requests_total", doc="/api/info requests made by the edit tracker")
+        try:
+            things = {thing.fullname: thing for thing in self.reddit.info(fullnames=[key_fullname(key) for key in keys])}
+        except PrawcoreException as ex:
+            logger.warning("Couldn't re-check %d items: %s", len(keys), ex)
+            for key in keys:
+                heapq.heappush(self.schedule, (now + FIRST_CHECK, key))
+            return
+        for key in keys:
+            item, delay = self.tracked[key]
+            thing = things.get(item.name)
+            if thing is None or _is_deleted(thing):
+                del self.tracked[key]
+                metrics.inc("reddit_stalker_changes_total", doc="Edits and deletions of emitted items", event="deleted")
+                emit("deleted", item, None)
+                continue
+            old, new = _text(item), _text(thing)
+            if new != old:
+                diff = "\n".join(
+                    line
+                    for line in difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=1)
+                    if not line.startswith(("---", "+++", "@@"))
+                )
+                item = snapshot(thing)
+                metrics.inc("reddit_stalker_changes_total", doc="Edits and deletions of emitted items", event="edited")
+                emit("edited", item, diff)
+            delay *= 2
+            if item.created_utc + self.window > now + delay:
+                self.tracked[key] = (item, delay)
+                heapq.heappush(self.schedule, (now + delay, key))
+            else:
+                del self.tracked[key]
+
+    def clear(self):
+        """
+        Stop tracking everything (when over the memory budget)
+        """
+        self.tracked.clear()
+        self.schedule = []
+        self._report()
@@ -0,0 +1,267 @@
+import logging
+import time
+from array import array
+import praw
+from prawcore.exceptions import Forbidden, NotFound
+from . import activity
+from .dedup import fullname_key, key_fullname
+from .listing import ListingStream
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Listings polled for each user, as (label suffix, praw Redditor attribute)
+KINDS = (("comments", "comments"), ("submitted", "submissions"))
+# ... and for each subreddit (entries named r/<name>), as (label suffix, praw Subreddit listing method)
+SUBREDDIT_KINDS = (("comments", "comments"), ("new", "new"))
+
+SKIP_EXISTING = 1
+INCLUDE_OLD = 2
+FIRST_ROUND = 4
+
+
+def is_subreddit(name):
+    return name.lower().startswith("r/")
+
+
+def label(name):
+    """
+    u/<user> or r/<subreddit>, for a table entry
+    """
+    return name if is_subreddit(name) else "u/" + name
+
+
+def source_name(stream_label):
+    """
+    The table entry a stream belongs to, from its label (u/<user>/<kind> or r/<subreddit>/<kind>)
+    """
+    prefix, name = stream_label.split("/")[:2]
+    return "r/" + name if prefix == "r" else name
+
+
+class UserTable:
+    """
+    Polling state for every followed user (and subreddit, as r/<name>), kept in flat arrays rather than in long-lived praw objects:
+    per listing, the cursor fullname (as an integer, 0 for none), praw's cache-busting counter and flags;
+    per user, the creation time of the newest item seen and when the user is next due.
+    Listing streams only exist while a user is being polled.
+
+    Users whose listings can't be read (suspended, deleted, shadowbanned...) are parked: only
+    polled again every `recheck` seconds.
+
+    With a `quiet_interval`, the hour-of-week activity of each user (see activity.py) is learned from their
+    items, and they are polled less often (up to every `quiet_interval` seconds) when they are usually inactive.
+    """
+
+    def __init__(self, pool, recheck=6 * 3600, quiet_interval=0):
+        self.pool = pool
+        self.recheck = recheck
+        self.quiet_interval = quiet_interval
+        self.parked = {}
+        self.names = []
+        self.index = {}
+        self.cursors = array("q")
+        self.counters = array("B")
+        self.flags = array("B")
+        self.last_seen = array("d")
+        self.next_due = array("d")
+        self.activity = array("f")
+        # Minimum time between two polls of each user, on top of the interval given to items()
+        self.intervals = array("f")
+
+    def __len__(self):
+        return len(self.names)
+
+    def _columns(self):
+        """
+        The state arrays, with the number of entries each keeps per user
+        """
+        return (
+            (self.cursors, len(KINDS)),
+            (self.counters, len(KINDS)),
+            (self.flags, len(KINDS)),
+            (self.last_seen, 1),
+            (self.next_due, 1),
+            (self.activity, activity.HOURS),
+            (self.intervals, 1),
+        )
+
+    def __contains__(self, name):
+        return name.lower() in self.index
+
+    def add(self, names, include_old=False, skip_existing=None):
+        """
+        Start polling `names`. By default, existing items are only included with include_old.
+        """
+        if skip_existing is None:
+            skip_existing = not include_old
+        flags = FIRST_ROUND | (SKIP_EXISTING if skip_existing else 0) | (INCLUDE_OLD if include_old else 0)
+        for name in names:
+            if name in self:
+                continue
+            self.pool.assign(name)
+            self.index[name.lower()] = len(self.names)
+            self.names.append(name)
+            for _ in KINDS:
+                self.cursors.append(0)
+                self.counters.append(0)
+                self.flags.append(flags)
+            self.last_seen.append(0)
+            self.next_due.append(0)
+            self.activity.frombytes(bytes(activity.HOURS * self.activity.itemsize))
+            self.intervals.append(0)
+
+    def remove(self, names):
+        """
+        Stop polling `names`, moving the last user into each freed slot to keep the arrays dense
+        """
+        for name in names:
+            index = self.index.pop(name.lower(), None)
+            if index is None:
+                continue
+            self.pool.release(name)
+            self.parked.pop(name.lower(), None)
+            last = len(self.names) - 1
+            if index != last:
+                self.names[index] = self.names[last]
+                self.index[self.names[index].lower()] = index
+                for column, width in self._columns():
+                    column[index * width : (index + 1) * width] = column[last * width : (last + 1) * width]
+            self.names.pop()
+            for column, width in self._columns():
+                del column[last * width :]
+
+    def _listing(self, name, kind):
+        reddit = self.pool.account_for(name)
+        if is_subreddit(name):
+            return getattr(praw.models.Subreddit(reddit, display_name=name[2:]), SUBREDDIT_KINDS[kind][1])
+        return getattr(praw.models.Redditor(reddit, name=name), KINDS[kind][1]).new
+
+    def _restore(self, index, kind):
+        slot = index * len(KINDS) + kind
+        flags = self.flags[slot]
+        return ListingStream(
+            self._listing(self.names[index], kind),
+            skip_existing=bool(flags & SKIP_EXISTING),
+            include_old=bool(flags & INCLUDE_OLD),
+            first_round=bool(flags & FIRST_ROUND),
+            before=key_fullname(self.cursors[slot]) if self.cursors[slot] else None,
+            without_before_counter=self.counters[slot],
+        )
+
+    def _save(self, index, kind, stream):
+        slot = index * len(KINDS) + kind
+        self.cursors[slot] = fullname_key(stream.before) if stream.before else 0
+        self.counters[slot] = stream.without_before_counter
+        self.flags[slot] = (
+            (SKIP_EXISTING if stream.skip_existing else 0)
+            | (INCLUDE_OLD if stream.include_old else 0)
+            | (FIRST_ROUND if stream.first_round else 0)
+        )
+        if stream.last_created:
+            self.last_seen[index] = max(self.last_seen[index], stream.last_created)
+        for created in stream.created:
+            activity.observe(self.activity, index * activity.HOURS, created)
+
+    def observe(self, name, created):
+        """
+        Count a past item of `name` (from the archive) in their activity model
+        """
+        index = self.index.get(name.lower())
+        if index is not None:
+            activity.observe(self.activity, index * activity.HOURS, created)
+
+    def _classify(self, name, error):
+        """
+        Why `name`'s listings fail, according to their profile (subreddits: according to the error)
+        """
+        if is_subreddit(name):
+            # Missing subreddits are NotFound, or a Redirect to the search
+            return "forbidden" if isinstance(error, Forbidden) else "deleted"
+        try:
+            about = self.pool.account_for(name).request(method="GET", path="user/%s/about" % name)["data"]
+        except NotFound:
+            return "deleted"
+        except Forbidden:
+            return "forbidden"
+        if about.get("is_suspended"):
+            return "suspended"
+        return "forbidden" if isinstance(error, Forbidden) else "unavailable"
+
+    def park(self, name, error):
+        """
+        Stop polling `name` until the recheck interval has passed
+        """
+        if name not in self:
+            return
+        reason = self._classify(name, error)
+        if self.parked.get(name.lower()) != reason:
+            logger.warning("%s looks %s (%s), checking again every %.1f hours", label(name), reason, error, self.recheck / 3600)
+        self.parked[name.lower()] = reason
+        self.schedule(name, time.time() + self.recheck)
+        self._report()
+
+    def _unpark(self, name):
+        if self.parked.pop(name.lower(), None):
+            logger.warning("%s is available again", label(name))
+            self._report()
+
+    def _report(self):
+        counts = {}
+        for reason in self.parked.values():
+            counts[reason] = counts.get(reason, 0) + 1
+        for reason in ("suspended", "deleted", "forbidden", "unavailable"):
+            metrics.set(
+                "reddit_stalker_parked_users",
+                counts.get(reason, 0),
+                doc="Users not polled because their account is inaccessible",
+                reason=reason,
+            )
+
+    def set_interval(self, names, seconds):
+        """
+        Poll `names` at most every `seconds` (the ones in the table)
+        """
+        for name in names:
+            index = self.index.get(name.lower())
+            if index is not None:
+                self.intervals[index] = seconds
+
+    def schedule(self, name, when):
+        self.next_due[self.index[name.lower()]] = when
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return [index for index in range(len(self.names)) if self.next_due[index] <= now]
+
+    def next_wakeup(self):
+        return min(self.next_due) if self.next_due else None
+
+    def items(self, interval=0):
+        """
+        (label, stream) for both listings of every due user, like dict.items() on a dict of streams.
+        A listing's state is saved back once the next one is requested, so a round interrupted
+        by an error is retried. Polled users are next due in `interval` seconds.
+        """
+        for name in [self.names[index] for index in self.due()]:
+            parked = name.lower() in self.parked
+            for kind, (suffix, _) in enumerate(SUBREDDIT_KINDS if is_subreddit(name) else KINDS):
+                # Look the user up again: the table may have changed since the round started
+                index = self.index.get(name.lower())
+                if index is None:
+                    break
+                stream = self._restore(index, kind)
+                yield "%s/%s" % (label(name), suffix), stream
+                index = self.index.get(name.lower())
+                if index is None or not stream.polled:
+                    # Unfollowed, or the listing couldn't be fetched (see park())
+                    break
+                self._save(index, kind, stream)
+            else:
+                if parked:
+                    self._unpark(name)
+                now = time.time()
+                index = self.index[name.lower()]
+                user_interval = max(interval, self.intervals[index])
+                delay = activity.poll_delay(self.activity, index * activity.HOURS, now, user_interval, self.quiet_interval)
+                self.schedule(name, now + delay)
@@ -0,0 +1,95 @@
+import json
+import logging
+import re
+from .items import item_text
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _trie_pattern(words):
+    """
+    A regex matching any of `words`, with common prefixes factored out (foo|food|fool -> foo(?:d|l)?),
+    so that the regex engine never backtracks over more than one alternative per character
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def pattern(node):
+        if list(node) == [""]:
+            return ""
+        optional = "" in node
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        result = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            result = ("(?:%s)" % result if len(branches) == 1 and len(result) > 1 else result) + "?"
+        return result
+
+    return pattern(trie)
+
+
+def compile_terms(terms):
+    """
+    One case-insensitive regex for all the terms: /.../ terms are regexes, the others are matched as whole words
+    (not preceded or followed by a word character, so that "c++" or ".net" can match too)
+    """
+    words = sorted({term.lower() for term in terms if not (len(term) > 2 and term.startswith("/") and term.endswith("/"))})
+    regexes = [term[1:-1] for term in terms if len(term) > 2 and term.startswith("/") and term.endswith("/")]
+    alternatives = ["(?:%s)" % regex for regex in regexes]
+    if words:
+        alternatives.insert(0, r"(?<!\w)" + _trie_pattern(words) + r"(?!\w)")
+    return re.compile("|".join(alternatives), re.IGNORECASE) if alternatives else None
+
+
+class Watcher:
+    """
+    Pipeline stage matching every item against the watch terms, with a single regex built at startup.
+    Matching items get a `watch_matches` attribute (the matched strings; see highlight())
+    and, with an alert file, a JSON line there.
+    """
+
+    def __init__(self, terms, alerts=None):
+        self.regex = compile_terms(terms)
+        self.alerts = open(alerts, "a") if alerts else None  # pylint: disable=consider-using-with
+        logger.info("Watching %d terms", len(terms))
+
+    def __call__(self, items):
+        if self.regex is None:
+            return items
+        for item in items:
+            matches = sorted(
+                {match.group(0).lower(): match.group(0) for match in self.regex.finditer(item_text(item))}.values(), key=str.lower
+            )
+            if not matches:
+                continue
+            item.watch_matches = matches
+            metrics.inc("reddit_stalker_watch_matches_total", doc="Items matching a watch term")
+            if self.alerts:
+                self.alerts.write(
+                    json.dumps(
+                        {
+                            "fullname": item.name,
+                            "author": str(item.author),
+                            "subreddit": item.subreddit.display_name,
+                            "created_utc": item.created_utc,
+                            "permalink": vars(item).get("permalink"),
+                            "matches": matches,
+                        }
+                    )
+                    + "\n"
+                )
+        if self.alerts:
+            self.alerts.flush()
+        return items
+
+    def highlight(self, text, before, after):
+        """
+        Wrap what the watch terms match in `text` in `before` and `after`
+        """
+        if self.regex is None:
+            return text
+        return self.regex.sub(lambda match: before + match.group(0) + after, text)
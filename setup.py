@@ -13,5 +13,6 @@ setup(
     packages=["reddit_stalker"],
     entry_points={"console_scripts": ["reddit-stalker=reddit_stalker.stream:main"]},
     install_requires=["praw", "colorama", "dateparser"],
+    extras_require={"stats": ["numpy"], "zstd": ["zstandard"]},
     zip_safe=False,
 )
@@ -0,0 +1,45 @@
+import pytest
+from reddit_stalker.dedup import SeenSet, fullname_key, key_fullname
+
+HOUR = 3600
+
+
+@pytest.mark.parametrize("fullname", ["t1_0", "t1_abc", "t3_zzzzzzz", "t2_1x9k", "t5_2qh1i"])
+def test_fullname_key_round_trip(fullname):
+    assert key_fullname(fullname_key(fullname)) == fullname
+
+
+def test_fullname_keys_keep_kinds_apart():
+    assert fullname_key("t1_abc") != fullname_key("t3_abc")
+    assert fullname_key("t1_abc") < fullname_key("t1_abd")
+
+
+def test_seen_set_rotation():
+    seen = SeenSet(max_age=HOUR)
+    seen.add("t1_a")
+    # One max_age later, "a" moves to the older generation
+    seen.rotated -= HOUR
+    seen.add("t1_b")
+    assert "t1_a" in seen and "t1_b" in seen
+    assert len(seen) == 2
+    # ... and is dropped at the next rotation
+    seen.rotated -= HOUR
+    seen.add("t1_c")
+    assert "t1_a" not in seen
+    assert "t1_b" in seen and "t1_c" in seen
+
+
+def test_seen_set_forgets_everything_after_two_max_ages():
+    seen = SeenSet(max_age=HOUR)
+    seen.add("t1_a")
+    seen.rotated -= 2 * HOUR
+    seen.add("t1_b")
+    assert "t1_a" not in seen
+    assert len(seen) == 1
+
+
+def test_seen_set_cutoff_after_shrink():
+    seen = SeenSet(max_age=HOUR)
+    assert seen.cutoff() < seen.rotated
+    seen.shrink()
+    assert seen.cutoff() == seen.rotated
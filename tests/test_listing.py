@@ -0,0 +1,78 @@
+import time
+from types import SimpleNamespace
+import pytest
+from reddit_stalker import listing
+from reddit_stalker.dedup import SeenSet
+from reddit_stalker.listing import ListingStream
+
+HOUR = 3600
+
+
+@pytest.fixture
+def seen(monkeypatch):
+    seen = SeenSet(max_age=3 * HOUR)
+    monkeypatch.setattr(listing, "seen", seen)
+    return seen
+
+
+def make_listing(items):
+    """
+    A listing function returning `items` (newest first, like reddit) after `before`
+    """
+
+    def function(limit, params):
+        names = [item.fullname for item in items]
+        end = names.index(params["before"]) if params.get("before") in names else len(items)
+        return items[:end][:limit]
+
+    return function
+
+
+def item(number, created):
+    return SimpleNamespace(fullname="t1_%s" % number, created_utc=created)
+
+
+def rounds(stream, count):
+    emitted = []
+    for _ in range(count):
+        for thing in iter(lambda: next(stream), None):
+            emitted.append(thing.fullname)
+    return emitted
+
+
+def test_new_items_are_emitted_once(seen):
+    now = time.time()
+    items = [item("b", now - 60), item("a", now - 120)]
+    stream = ListingStream(make_listing(items))
+    assert rounds(stream, 1) == ["t1_a", "t1_b"]
+    items.insert(0, item("c", now))
+    assert rounds(stream, 2) == ["t1_c"]
+
+
+def test_skip_existing(seen):
+    now = time.time()
+    items = [item("a", now - 60)]
+    stream = ListingStream(make_listing(items), skip_existing=True)
+    assert rounds(stream, 1) == []
+    items.insert(0, item("b", now))
+    assert rounds(stream, 1) == ["t1_b"]
+
+
+def test_old_items_are_ignored_unless_included(seen):
+    now = time.time()
+    items = [item("a", now - 4 * HOUR)]
+    assert rounds(ListingStream(make_listing(items)), 1) == []
+    assert rounds(ListingStream(make_listing(items), include_old=True), 1) == ["t1_a"]
+
+
+def test_shrunk_seen_set_does_not_bring_items_back(seen):
+    now = time.time()
+    items = [item("b", now - 2 * HOUR), item("a", now - 2.5 * HOUR)]
+    assert rounds(ListingStream(make_listing(items)), 1) == ["t1_a", "t1_b"]
+    # A rotation moves them to the older generation, which shrink() drops
+    seen.rotated -= seen.max_age
+    seen.add("t1_other")
+    seen.shrink()
+    assert "t1_a" not in seen
+    # A stream without a cursor reads the whole listing again
+    assert rounds(ListingStream(make_listing(items)), 1) == []
@@ -0,0 +1,87 @@
+import concurrent.futures
+import threading
+import time
+from types import SimpleNamespace
+from reddit_stalker.pipeline import Pipeline
+
+
+class FakeDeferred:
+    """
+    A deferred stage whose futures only complete when the test says so
+    """
+
+    def __init__(self):
+        self.futures = []
+        self.closed = False
+
+    def submit(self, items):
+        future = concurrent.futures.Future()
+        self.futures.append((future, items))
+        return future
+
+    def finish(self, number, tag):
+        future, items = self.futures[number]
+        for item in items:
+            item.tag = tag
+        future.set_result(items)
+
+    def shutdown(self):
+        self.closed = True
+
+
+def item(number):
+    return SimpleNamespace(name="t1_%d" % number, created_utc=number)
+
+
+def make_pipeline(deferred_timeout=60):
+    output = []
+    deferred = FakeDeferred()
+    pipeline = Pipeline([], output.append, batch_size=2, deferred=deferred, deferred_timeout=deferred_timeout)
+    return pipeline, deferred, output
+
+
+def test_batches_wait_for_the_deferred_stage_in_order():
+    pipeline, deferred, output = make_pipeline()
+    for number in range(4):
+        pipeline(item(number))
+    assert len(deferred.futures) == 2 and output == []
+    # The second batch is done first, but has to wait for the first one
+    deferred.finish(1, "late")
+    pipeline.flush()
+    assert output == []
+    deferred.finish(0, "early")
+    pipeline.flush()
+    assert [(thing.created_utc, thing.tag) for thing in output] == [(0, "early"), (1, "early"), (2, "late"), (3, "late")]
+
+
+def test_timed_out_batches_are_output_as_submitted():
+    pipeline, deferred, output = make_pipeline(deferred_timeout=0.05)
+    pipeline(item(1))
+    pipeline(item(0))
+    pipeline.flush()
+    assert output == []
+    time.sleep(0.1)
+    pipeline.flush()
+    assert [thing.created_utc for thing in output] == [0, 1]
+    assert all("tag" not in vars(thing) for thing in output)
+    assert deferred.futures[0][0].cancelled()
+
+
+def test_close_waits_for_pending_batches_until_their_deadline():
+    pipeline, deferred, output = make_pipeline(deferred_timeout=5)
+    pipeline(item(0))
+    pipeline(item(1))
+    threading.Timer(0.05, deferred.finish, (0, "done")).start()
+    started = time.time()
+    pipeline.close()
+    assert time.time() - started < 5
+    assert [thing.tag for thing in output] == ["done", "done"]
+    assert deferred.closed
+
+
+def test_close_gives_up_on_batches_past_their_deadline():
+    pipeline, deferred, output = make_pipeline(deferred_timeout=0.05)
+    pipeline(item(0))
+    pipeline.close()
+    assert [thing.created_utc for thing in output] == [0]
+    assert deferred.closed
@@ -0,0 +1,42 @@
+from reddit_stalker.sharding import HashRing, shard_followings
+
+USERS = ["user%d" % number for number in range(2000)]
+
+
+def test_every_user_gets_one_node():
+    assignments = HashRing(["a", "b", "c"]).assign(USERS)
+    assert sorted(user for users in assignments.values() for user in users) == sorted(USERS)
+    # Roughly balanced
+    assert all(len(users) > len(USERS) / 6 for users in assignments.values())
+
+
+def test_lookups_ignore_case():
+    ring = HashRing(["a", "b", "c"])
+    assert all(ring.node_for(user) == ring.node_for(user.upper()) for user in USERS)
+
+
+def test_adding_a_node_only_moves_users_to_it():
+    ring = HashRing(["a", "b", "c"])
+    before = {user: ring.node_for(user) for user in USERS}
+    ring.add("d")
+    moved = {user for user in USERS if ring.node_for(user) != before[user]}
+    assert moved
+    assert all(ring.node_for(user) == "d" for user in moved)
+
+
+def test_removing_a_node_only_moves_its_users():
+    ring = HashRing(["a", "b", "c"])
+    before = {user: ring.node_for(user) for user in USERS}
+    ring.remove("b")
+    for user in USERS:
+        if before[user] != "b":
+            assert ring.node_for(user) == before[user]
+        else:
+            assert ring.node_for(user) in ("a", "c")
+
+
+def test_shard_followings():
+    followings = {"Alice": ["x"], "bob": ["y"], "carol": ["z"]}
+    shards = [shard_followings(followings, ["n1", "n2"], node) for node in ("n1", "n2")]
+    assert {name for shard in shards for name in shard} == set(followings)
+    assert not set(shards[0]) & set(shards[1])
@@ -0,0 +1,117 @@
+import http.server
+import json
+import threading
+import pytest
+from reddit_stalker import sinks
+from reddit_stalker.sinks import Event, QueuedSink, WebhookSink, make_sinks
+
+
+class Endpoint(http.server.ThreadingHTTPServer):
+    """
+    A webhook receiver answering with the statuses in `statuses` (then 200), recording the batches it accepts
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.statuses = []
+        self.requests = 0
+        self.received = []
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/hook" % self.server_port
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):  # noqa: N802
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        if status == 200:
+            self.server.received.append([record["n"] for record in json.loads(body)])
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    monkeypatch.setattr(sinks, "BACKOFF", 0.001)
+    monkeypatch.setattr(sinks, "MAX_BACKOFF", 0.01)
+    endpoint = Endpoint()
+    yield endpoint
+    endpoint.shutdown()
+    endpoint.server_close()
+
+
+def entries(*numbers):
+    return [Event({"n": number}, str(number)) for number in numbers]
+
+
+def test_retries_server_errors(endpoint):
+    endpoint.statuses = [503, 500]
+    WebhookSink(endpoint.url, retries=2).write(entries(1, 2))
+    assert endpoint.requests == 3
+    assert endpoint.received == [[1, 2]]
+
+
+def test_client_errors_are_not_retried(endpoint):
+    endpoint.statuses = [400]
+    WebhookSink(endpoint.url, retries=2).write(entries(1))
+    assert endpoint.requests == 1
+    assert endpoint.received == []
+
+
+def test_undeliverable_batches_are_spooled_then_sent_first(endpoint, tmp_path):
+    spool = tmp_path / "spool"
+    sink = WebhookSink(endpoint.url, retries=1, spool=str(spool))
+    endpoint.statuses = [503, 503]
+    sink.write(entries(1))
+    assert endpoint.received == []
+    # While the endpoint is known to be down, batches go straight to the spool
+    sink.write(entries(2))
+    assert endpoint.requests == 2
+    assert len(spool.read_bytes().splitlines()) == 2
+    sink.down_until = 0
+    sink.write(entries(3))
+    assert endpoint.received == [[3], [1], [2]]
+    assert not spool.exists()
+
+
+def test_failed_unspooling_keeps_the_rest(endpoint, tmp_path):
+    spool = tmp_path / "spool"
+    spool.write_bytes(b'[{"n": 1}]\n[{"n": 2}]\n')
+    sink = WebhookSink(endpoint.url, retries=0, spool=str(spool))
+    endpoint.statuses = [200, 200, 503]
+    sink.write(entries(3))
+    assert endpoint.received == [[3], [1]]
+    assert spool.read_bytes() == b'[{"n": 2}]\n'
+
+
+def test_queued_webhook_sends_batches_and_closes(endpoint):
+    sink = QueuedSink(WebhookSink(endpoint.url), batch_size=2, max_delay=0.05, workers=2)
+    sink.write(entries(1, 2, 3))
+    sink.close()
+    assert not any(thread.is_alive() for thread in sink.threads)
+    assert sorted(number for batch in endpoint.received for number in batch) == [1, 2, 3]
+    assert [] not in endpoint.received
+
+
+def test_each_webhook_gets_its_own_spool(tmp_path):
+    spool = str(tmp_path / "spool")
+    outputs = make_sinks(
+        ["webhook:http://a.invalid/", "webhook:http://b.invalid/", "file:" + str(tmp_path / "out")], webhook_spool=spool
+    )
+    try:
+        spools = [output.sink.spool for output in outputs[:2]]
+        assert len(set(spools)) == 2 and all(path.startswith(spool + ".") for path in spools)
+        assert make_sinks(["webhook:http://a.invalid/"], webhook_spool=spool)[0].sink.spool == spool
+    finally:
+        for output in outputs:
+            output.close()
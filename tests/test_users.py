@@ -0,0 +1,76 @@
+from reddit_stalker.users import KINDS, UserTable
+
+
+class FakePool:
+    def __init__(self):
+        self.assigned = set()
+
+    def assign(self, name):
+        self.assigned.add(name.lower())
+
+    def release(self, name):
+        self.assigned.discard(name.lower())
+
+
+def fill(table):
+    """
+    Give every user distinct values in every column, derived from their name
+    """
+    for index, name in enumerate(table.names):
+        number = ord(name[-1])
+        for kind in range(len(KINDS)):
+            table.cursors[index * len(KINDS) + kind] = number * 10 + kind
+            table.counters[index * len(KINDS) + kind] = number + kind
+        table.last_seen[index] = number * 100.0
+        table.next_due[index] = number * 1000.0
+        table.intervals[index] = number
+
+
+def state(table, name):
+    index = table.index[name.lower()]
+    width = len(KINDS)
+    return (
+        list(table.cursors[index * width : (index + 1) * width]),
+        list(table.counters[index * width : (index + 1) * width]),
+        table.last_seen[index],
+        table.next_due[index],
+        table.intervals[index],
+    )
+
+
+def test_remove_moves_the_last_user_into_the_freed_slot():
+    table = UserTable(FakePool())
+    table.add(["user_a", "user_b", "User_c", "user_d"])
+    fill(table)
+    before = {name: state(table, name) for name in ("user_a", "User_c", "user_d")}
+    table.remove(["USER_B"])
+    assert table.names == ["user_a", "user_d", "User_c"]
+    assert table.index == {"user_a": 0, "user_d": 1, "user_c": 2}
+    assert "user_b" not in table
+    for name, values in before.items():
+        assert state(table, name) == values
+    for column, width in table._columns():
+        assert len(column) == len(table) * width
+    assert table.pool.assigned == {"user_a", "user_c", "user_d"}
+
+
+def test_remove_last_and_unknown_users():
+    table = UserTable(FakePool())
+    table.add(["user_a", "user_b"])
+    fill(table)
+    expected = state(table, "user_a")
+    table.remove(["user_b", "nobody"])
+    assert table.names == ["user_a"]
+    assert state(table, "user_a") == expected
+    table.remove(["user_a"])
+    assert len(table) == 0
+    assert all(len(column) == 0 for column, _ in table._columns())
+
+
+def test_removed_users_can_be_added_again():
+    table = UserTable(FakePool())
+    table.add(["user_a", "user_b"])
+    table.remove(["user_a"])
+    table.add(["user_a"])
+    assert table.names == ["user_b", "user_a"]
+    assert table.index == {"user_b": 0, "user_a": 1}
@@ -0,0 +1,57 @@
+import re
+from types import SimpleNamespace
+import pytest
+from reddit_stalker.watch import Watcher, _trie_pattern, compile_terms
+
+
+@pytest.mark.parametrize("words", [["foo"], ["foo", "food", "fool"], ["a", "ab", "abc", "b"], ["c++", ".net", "f#"]])
+def test_trie_pattern_matches_exactly_the_words(words):
+    regex = re.compile("(?:%s)$" % _trie_pattern(words))
+    for word in words:
+        assert regex.match(word)
+    for other in ("fo", "foods", "abcd", "c+", "net", "bar"):
+        if other not in words:
+            assert not regex.match(other)
+
+
+def test_trie_pattern_factors_prefixes():
+    assert _trie_pattern(["foo", "food", "fool"]) == "foo(?:d|l)?"
+    assert _trie_pattern(["a", "ab", "abc", "b"]) == "(?:a(?:bc?)?|b)"
+
+
+def test_trie_pattern_escapes_metacharacters():
+    regex = re.compile(_trie_pattern(["a.b", "(x)"]))
+    assert regex.fullmatch("a.b") and regex.fullmatch("(x)")
+    assert not regex.fullmatch("axb")
+
+
+def matches(terms, text):
+    regex = compile_terms(terms)
+    return [match.group(0) for match in regex.finditer(text)]
+
+
+def test_words_match_whole_words_only():
+    assert matches(["rust"], "Rust, trust and rusty") == ["Rust"]
+    assert matches(["foo", "food"], "food foo") == ["food", "foo"]
+
+
+def test_words_with_symbols():
+    assert matches(["c++", ".net"], "I like C++ and .NET, not c++x") == ["C++", ".NET"]
+
+
+def test_regex_terms():
+    assert matches([r"/\bv\d+\b/", "python"], "python v3 and v12x") == ["python", "v3"]
+
+
+def test_no_terms():
+    assert compile_terms([]) is None
+
+
+def test_watcher_marks_matching_items():
+    watcher = Watcher(["python", "/go(lang)?/"])
+    hit = SimpleNamespace(title="Python or Golang?", selftext="", body=None)
+    miss = SimpleNamespace(body="nothing here")
+    assert watcher([hit, miss]) == [hit, miss]
+    assert hit.watch_matches == ["Golang", "Python"]
+    assert "watch_matches" not in vars(miss)
+    assert watcher.highlight("golang", "<", ">") == "<golang>"